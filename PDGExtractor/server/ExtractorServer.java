@@ -0,0 +1,88 @@
+import java.io.BufferedReader;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.nio.charset.StandardCharsets;
+import java.security.Permission;
+import java.util.jar.JarFile;
+
+/**
+ * Keeps one JVM around for the PDG extractor jar, see deltaPDG/Util/extractor_worker.py.
+ *
+ * Usage: java -cp TinyPDG-1.0.0.jar PDGExtractor/server/ExtractorServer.java TinyPDG-1.0.0.jar
+ *
+ * Reads one request per line on stdin, tab separated arguments for the jar's main class, and answers each with "ok" or
+ * "error message" on stdout. "ping" is answered with "pong". Whatever the extractor prints goes to stderr.
+ */
+public class ExtractorServer {
+
+    private static final class ExitTrapped extends SecurityException {
+        final int status;
+
+        ExitTrapped(int status) {
+            super("System.exit(" + status + ")");
+            this.status = status;
+        }
+    }
+
+    @SuppressWarnings("removal")
+    private static void trapExit() {
+        // Keeps the JVM alive when the extractor calls System.exit, only possible up to Java 17. Later versions leave
+        // the server to die, which the Python side notices and handles by starting it again.
+        try {
+            System.setSecurityManager(new SecurityManager() {
+                @Override
+                public void checkPermission(Permission perm) {
+                }
+
+                @Override
+                public void checkExit(int status) {
+                    throw new ExitTrapped(status);
+                }
+            });
+        } catch (UnsupportedOperationException | SecurityException e) {
+            System.err.println("ExtractorServer: cannot trap System.exit (" + e + ")");
+        }
+    }
+
+    public static void main(String[] args) throws Exception {
+        String mainClass;
+        try (JarFile jar = new JarFile(args[0])) {
+            mainClass = jar.getManifest().getMainAttributes().getValue("Main-Class");
+        }
+        Method main = Class.forName(mainClass).getMethod("main", String[].class);
+
+        PrintStream protocol = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        System.setOut(System.err);
+        trapExit();
+
+        BufferedReader requests = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        protocol.println("ready");
+        String line;
+        while ((line = requests.readLine()) != null) {
+            if (line.equals("ping")) {
+                protocol.println("pong");
+                continue;
+            }
+            try {
+                main.invoke(null, (Object) line.split("\t"));
+                protocol.println("ok");
+            } catch (InvocationTargetException e) {
+                Throwable cause = e.getCause();
+                if (cause instanceof ExitTrapped && ((ExitTrapped) cause).status == 0) {
+                    protocol.println("ok");
+                } else {
+                    cause.printStackTrace();
+                    protocol.println("error " + String.valueOf(cause).replace('\n', ' '));
+                }
+            } catch (Throwable e) {
+                e.printStackTrace();
+                protocol.println("error " + String.valueOf(e).replace('\n', ' '));
+            }
+            System.err.flush();
+        }
+    }
+}
@@ -9,14 +9,17 @@ import scipy.sparse
 from tqdm import tqdm
 
 from Util.evaluation import evaluate
-from Util.general_util import get_pattern_paths
+from Util.general_util import get_pattern_paths, parse_graph_flags
+from confidence_voters.Util.co_change import CoChange
 from confidence_voters.Util.generate_corpus_file import build_occurrence_matrix, build_corpus
 from confidence_voters.confidence_voters import cluster_diffs, convert_diff_to_diff_regions
 from confidence_voters.confidence_voters_graph_only import cluster_diffs as graph_cluster_diffs
-from deltaPDG.Util.pygraph_util import read_graph_from_dot, obj_dict_to_networkx, get_context_from_nxgraph
+from deltaPDG.Util.commit_index import commit_index_location
+from deltaPDG.Util.corpus_store import CorpusEntry, CorpusStore, corpus_store_location, datapoint_of
+from deltaPDG.Util.pygraph_util import read_delta_graph, get_context_from_nxgraph
 
 
-def driver(times_, out_name_, projects_, worker_wrapper_, temp_dir_):
+def driver(times_, out_name_, projects_, worker_wrapper_, temp_dir_, graph_name_='merged.dot', store_=False):
     for repository_name in tqdm(projects_):
         json_location = './out/%s/%s_history.json' % (repository_name, repository_name)
         subject_location = './subjects/%s' % repository_name
@@ -34,13 +37,19 @@ def driver(times_, out_name_, projects_, worker_wrapper_, temp_dir_):
                 file_index_map = jsonpickle.decode(f.read())
             occurrence_matrix = scipy.sparse.load_npz('./out/%s/occurrence_matrix.npz' % repository_name)
         except FileNotFoundError:
-            occurrence_matrix, file_index_map = build_occurrence_matrix(subject_location, temp_dir_, None)
+            occurrence_matrix, file_index_map = build_occurrence_matrix(
+                subject_location, temp_dir_, None, commit_index_location('./out/%s' % repository_name, repository_name))
             with open('./out/%s/file_index.json' % repository_name, 'w') as f:
                 f.write(jsonpickle.encode(file_index_map))
             scipy.sparse.save_npz('./out/%s/occurrence_matrix.npz' % repository_name, occurrence_matrix)
-
-        all_graphs = sorted(
-            get_pattern_paths('*merged.dot', os.path.join('.', 'data', 'corpora_clean', repository_name)))
+        co_change = CoChange.for_project('./out/%s/occurrence_matrix.npz' % repository_name, occurrence_matrix,
+                                         file_index_map)
+
+        if store_:
+            all_graphs = CorpusStore(corpus_store_location(repository_name)).entries()
+        else:
+            all_graphs = sorted(
+                get_pattern_paths('*' + graph_name_, os.path.join('.', 'data', 'corpora_clean', repository_name)))
         os.makedirs('./out/%s' % repository_name, exist_ok=True)
 
         try:
@@ -59,8 +68,7 @@ def driver(times_, out_name_, projects_, worker_wrapper_, temp_dir_):
         except FileNotFoundError:
             pass
 
-        all_graphs = [d for d in all_graphs
-                      if os.path.basename(os.path.dirname(os.path.dirname(d))) not in datapoints_done]
+        all_graphs = [d for d in all_graphs if datapoint_of(d)[0] not in datapoints_done]
         random.shuffle(all_graphs)
 
         corpus = {k: (i, convert_diff_to_diff_regions(v)) for k, (i, v) in corpus.items()}
@@ -72,7 +80,8 @@ def driver(times_, out_name_, projects_, worker_wrapper_, temp_dir_):
             chunck_size = int(len(work_list) / n_workers)
         chuncked = [work_list[i:i + chunck_size] for i in range(0, len(work_list), chunck_size)]
 
-        worker = worker_wrapper_(corpus, file_len_map, repository_name, occurrence_matrix, file_index_map, times_)
+        worker = worker_wrapper_(corpus, file_len_map, repository_name, occurrence_matrix, file_index_map, times_,
+                                 co_change)
 
         threads = []
         for work in chuncked:
@@ -88,24 +97,21 @@ def driver(times_, out_name_, projects_, worker_wrapper_, temp_dir_):
 
 
 if __name__ == '__main__':
-    times = int(sys.argv[1])
-    out_name = sys.argv[2]
-    graph_version = True if sys.argv[3].lower() == 'true' else False
+    graph_name, store, graph_cache, args = parse_graph_flags(sys.argv)
+    times = int(args[1])
+    out_name = args[2]
+    graph_version = True if args[3].lower() == 'true' else False
     if graph_version:
-        projects = sys.argv[4:]
+        projects = args[4:]
 
 
-        def worker_wrapper(_, file_len_map, repository_name, occurrence_matrix, file_index_map, times_):
+        def worker_wrapper(_, file_len_map, repository_name, occurrence_matrix, file_index_map, times_, co_change):
             def worker(work):
-                for data_point_name in tqdm(work, leave=False):
-                    concepts = int(os.path.basename(os.path.dirname(data_point_name)))
-                    data_point_name = os.path.basename(os.path.dirname(os.path.dirname(data_point_name)))
+                for graph_location in tqdm(work, leave=False):
+                    data_point_name, concepts = datapoint_of(graph_location)
                     try:
                         file_lens = file_len_map[data_point_name]
-                        graph_location = os.path.join('.', 'data', 'corpora_clean',
-                                                      repository_name, data_point_name,
-                                                      str(concepts), 'merged.dot')
-                        deltaPDG = obj_dict_to_networkx(read_graph_from_dot(graph_location))
+                        deltaPDG = read_delta_graph(graph_location, graph_cache)
                         context = get_context_from_nxgraph(deltaPDG)
 
                         try:
@@ -121,7 +127,8 @@ if __name__ == '__main__':
                                                             file_lens,
                                                             occurrence_matrix,
                                                             file_index_map,
-                                                            times_)
+                                                            times_,
+                                                            co_change=co_change)
                         truth = np.asarray(truth).astype(int)
                         labels = np.asarray(labels).astype(int)
                         acc, overlap = evaluate(labels, truth,
@@ -140,14 +147,14 @@ if __name__ == '__main__':
 
             return worker
     else:
-        edges_to_keep = sys.argv[4]
+        edges_to_keep = args[4]
         if edges_to_keep == 'None':
             edges_to_keep = None
-        use_file_dist = sys.argv[5].lower() == 'true'
-        use_call_distance = sys.argv[6].lower() == 'true'
-        use_data = sys.argv[7].lower() == 'true'
-        use_namespace = sys.argv[8].lower() == 'true'
-        use_change_coupling = sys.argv[9].lower() == 'true'
+        use_file_dist = args[5].lower() == 'true'
+        use_call_distance = args[6].lower() == 'true'
+        use_data = args[7].lower() == 'true'
+        use_namespace = args[8].lower() == 'true'
+        use_change_coupling = args[9].lower() == 'true'
 
         suffix = '_'
         if use_file_dist:
@@ -161,13 +168,14 @@ if __name__ == '__main__':
         if use_change_coupling:
             suffix += 'cc_'
 
-        projects = sys.argv[10:]
+        projects = args[10:]
 
 
-        def worker_wrapper(corpus, file_len_map, repository_name, occurrence_matrix, file_index_map, times_):
+        def worker_wrapper(corpus, file_len_map, repository_name, occurrence_matrix, file_index_map, times_,
+                           co_change):
             def worker(work):
-                for data_point_name in tqdm(work, leave=False):
-                    data_point_name = os.path.basename(os.path.dirname(os.path.dirname(data_point_name)))
+                for graph_location in tqdm(work, leave=False):
+                    data_point_name, _ = datapoint_of(graph_location)
                     try:
                         concepts, data = corpus[data_point_name]
                     except KeyError:
@@ -178,11 +186,15 @@ if __name__ == '__main__':
                                 file_lens = file_len_map[data_point_name]
                             except KeyError:
                                 continue
+                            if isinstance(graph_location, CorpusEntry):
+                                graph_location = graph_location.store.entry(data_point_name, concepts)
+                            else:
+                                graph_location = os.path.join('.', 'data', 'corpora_clean',
+                                                              repository_name, data_point_name,
+                                                              str(concepts), graph_name)
                             labels, time_ = cluster_diffs(concepts,
                                                           data,
-                                                          os.path.join('.', 'data', 'corpora_clean',
-                                                                       repository_name, data_point_name,
-                                                                       str(concepts), 'merged.dot'),
+                                                          graph_location,
                                                           file_lens,
                                                           occurrence_matrix,
                                                           file_index_map,
@@ -191,7 +203,9 @@ if __name__ == '__main__':
                                                           use_call_distance=use_call_distance,
                                                           use_change_coupling=use_change_coupling,
                                                           use_data=use_data,
-                                                          use_namespace=use_namespace)
+                                                          use_namespace=use_namespace,
+                                                          graph_cache=graph_cache,
+                                                          co_change=co_change)
                             truth = [p['label'] for p in data]
                             acc, overlap = evaluate(labels, np.asarray(truth), q=concepts)
                             with open('./out/%s/bl_results%s.csv' % (repository_name, suffix), 'a') as f:
@@ -204,4 +218,7 @@ if __name__ == '__main__':
 
             return worker
 
-    driver(times, out_name, projects, worker_wrapper, temp_dir_='./tmp/work')
+    driver(times, out_name, projects, worker_wrapper, temp_dir_='./tmp/work', graph_name_=graph_name,
+           store_=store)
+    if graph_cache is not None:
+        print('[Graph cache] %d hits, %d misses' % (graph_cache.hits, graph_cache.misses))
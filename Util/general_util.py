@@ -1,6 +1,8 @@
 import os
 from fnmatch import fnmatch
-from typing import List
+from typing import List, Optional, Tuple
+
+from deltaPDG.Util.graph_cache import GraphCache
 
 
 def get_pattern_paths(pattern: str, path: str) -> List[str]:
@@ -17,3 +19,19 @@ def get_pattern_paths(pattern: str, path: str) -> List[str]:
             if fnmatch(name, pattern):
                 files_paths.append(os.path.join(subpath, name))
     return files_paths
+
+
+def parse_graph_flags(argv: List[str]) -> Tuple[str, bool, Optional[GraphCache], List[str]]:
+    """
+    Take the flags of the evaluation drivers that choose how the merged graphs are read out of their arguments
+        --binary    Read the merged.npz files written by tangle_concerns/convert_corpora_to_binary.py
+        --store     Read the project archives written by tangle_concerns/convert_corpora_to_binary.py --store
+        --no-cache  Do not keep parsed .dot files in ./tmp/graph_cache between passes
+    :param argv: The command line, e.g. sys.argv, which is left as it is
+    :return: The file name of the merged graphs, whether to read the archives, the graph cache (None with --no-cache)
+    and the remaining arguments
+    """
+    flags = {'--binary', '--store', '--no-cache'}
+    graph_name = 'merged.npz' if '--binary' in argv else 'merged.dot'
+    graph_cache = None if '--no-cache' in argv else GraphCache()
+    return graph_name, '--store' in argv, graph_cache, [arg for arg in argv if arg not in flags]
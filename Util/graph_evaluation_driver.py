@@ -4,25 +4,31 @@ import sys
 import jsonpickle
 from tqdm import tqdm
 
-from Util.general_util import get_pattern_paths
+from Util.general_util import get_pattern_paths, parse_graph_flags
+from deltaPDG.Util.corpus_store import CorpusStore, corpus_store_location, datapoint_of
 
 if __name__ == '__main__':
-    times = int(sys.argv[1])
-    mode = sys.argv[2].lower()  # Options are du and wl
+    graph_name, store, graph_cache, args = parse_graph_flags(sys.argv)
+    graph_pattern = '*' + graph_name
+    times = int(args[1])
+    mode = args[2].lower()  # Options are du and wl
     if mode == 'du':
         from du_chains.DU_chains_closure import validate as du_validate
-        repository_names = sys.argv[3:]
+        repository_names = args[3:]
         out_name = 'du_results_raw'
     else:
         from wl_kernel.wl_kernel_untangle import validate as wl_validate
         edges_kept = 'all'
-        k_hop = int(sys.argv[3])
-        repository_names = sys.argv[4:]
+        k_hop = int(args[3])
+        repository_names = args[4:]
         out_name = 'wl_%s_%d_results_raw' % (edges_kept, k_hop)
 
     for repository_name in tqdm(repository_names):
-        all_graphs = sorted(
-            get_pattern_paths('*merged.dot', os.path.join('.', 'data', 'corpora_clean', repository_name)))
+        if store:
+            all_graphs = CorpusStore(corpus_store_location(repository_name)).entries()
+        else:
+            all_graphs = sorted(
+                get_pattern_paths(graph_pattern, os.path.join('.', 'data', 'corpora_clean', repository_name)))
         os.makedirs('./out/%s' % repository_name, exist_ok=True)
         try:
             with open('./out/%s/%s.csv' % (repository_name, out_name)) as f:
@@ -39,11 +45,12 @@ if __name__ == '__main__':
                 continue
         except FileNotFoundError:
             pass
-        all_graphs = [d for d in all_graphs
-                      if os.path.basename(os.path.dirname(os.path.dirname(d))) not in datapoints_done]
+        all_graphs = [d for d in all_graphs if datapoint_of(d)[0] not in datapoints_done]
         if mode == 'du':
-            du_validate(all_graphs, times, repository_name)
+            du_validate(all_graphs, times, repository_name, graph_cache=graph_cache)
         else:
-            wl_validate(all_graphs, times, k_hop, repository_name)
+            wl_validate(all_graphs, times, k_hop, repository_name, graph_cache=graph_cache)
         with open('./out/%s/%s.json' % (repository_name, out_name), 'w') as f:
             f.write(jsonpickle.encode({'done'}))
+    if graph_cache is not None:
+        print('[Graph cache] %d hits, %d misses' % (graph_cache.hits, graph_cache.misses))
@@ -0,0 +1,98 @@
+"""
+File co-change counts for the change_coupling voters (Zimmermann et al. 2004), computed once per project from the
+file x commit occurrence matrix instead of scanning every commit for every pair of files.
+"""
+import os
+import threading
+from typing import Dict, List
+
+import numpy as np
+import scipy.sparse
+
+CO_CHANGE_NAME = 'co_change_matrix.npz'
+
+
+def co_change_location(occurrence_location: str) -> str:
+    """
+    Where the co-change counts of a project live, next to its occurrence_matrix.npz.
+    """
+    return os.path.join(os.path.dirname(occurrence_location), CO_CHANGE_NAME)
+
+
+class CoChange(object):
+    """
+    counts[f1, f2] sums the occurrences of f1 over the commits that touched both f1 and f2, i.e. A (A != 0)^T for the
+    occurrence matrix A. For a 0/1 matrix that is the number of commits the two files changed in together.
+
+    The coupling of two files is min(counts[f1, f2], counts[f2, f1]) / max(...), 0 when they never changed together or
+    one of them is not in the file index.
+    """
+
+    def __init__(self, counts: scipy.sparse.csr_matrix, file_index: Dict[str, int]):
+        self.counts = counts.tocsr()
+        self.file_index = file_index
+        self._rows = dict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def from_occurrence_matrix(occurrence_matrix, file_index: Dict[str, int]) -> 'CoChange':
+        occurrence_matrix = scipy.sparse.csr_matrix(occurrence_matrix)
+        return CoChange(occurrence_matrix @ (occurrence_matrix != 0).T.astype(occurrence_matrix.dtype), file_index)
+
+    @staticmethod
+    def load(location: str, file_index: Dict[str, int]) -> 'CoChange':
+        return CoChange(scipy.sparse.load_npz(location), file_index)
+
+    def save(self, location: str):
+        scipy.sparse.save_npz(location, self.counts)
+
+    @staticmethod
+    def for_project(occurrence_location: str, occurrence_matrix, file_index: Dict[str, int]) -> 'CoChange':
+        """
+        The co-change counts stored next to occurrence_location, computed and stored first when there are none yet or
+        they are older than the occurrence matrix.
+        """
+        location = co_change_location(occurrence_location)
+        try:
+            if os.path.getmtime(location) >= os.path.getmtime(occurrence_location):
+                co_change = CoChange.load(location, file_index)
+                if co_change.counts.shape == (occurrence_matrix.shape[0],) * 2:
+                    return co_change
+        except OSError:
+            pass
+        co_change = CoChange.from_occurrence_matrix(occurrence_matrix, file_index)
+        co_change.save(location)
+        return co_change
+
+    def _row(self, i: int) -> Dict[int, int]:
+        try:
+            return self._rows[i]
+        except KeyError:
+            start, end = self.counts.indptr[i], self.counts.indptr[i + 1]
+            row = dict(zip(self.counts.indices[start:end].tolist(), self.counts.data[start:end].tolist()))
+            with self._lock:
+                return self._rows.setdefault(i, row)
+
+    def count(self, file1: str, file2: str) -> int:
+        try:
+            return self._row(self.file_index[file1]).get(self.file_index[file2], 0)
+        except KeyError:
+            return 0
+
+    def coupling(self, file1: str, file2: str) -> float:
+        count1 = self.count(file1, file2)
+        count2 = self.count(file2, file1)
+        return min(count1, count2) / max(count1, count2) if max(count1, count2) > 0 else .0
+
+    def coupling_matrix(self, files: List[str]) -> np.ndarray:
+        """
+        The pairwise coupling of files, e.g. all files of a commit, as a len(files) x len(files) array.
+        """
+        known = [i for i, file in enumerate(files) if file in self.file_index]
+        rows = [self.file_index[files[i]] for i in known]
+        counts = self.counts[rows][:, rows].toarray().astype(float)
+        high = np.maximum(counts, counts.T)
+        low = np.minimum(counts, counts.T)
+        result = np.zeros((len(files), len(files)))
+        result[np.ix_(known, known)] = np.divide(low, high, out=np.zeros_like(low), where=high > 0)
+        return result
@@ -2,16 +2,18 @@ import os
 import random
 import sys
 from collections import defaultdict
-from functools import reduce
 from threading import Thread
 from typing import List, Dict
 
 import jsonpickle
+import numpy as np
 import scipy.sparse
 import scipy.spatial
 import scipy.special
 from tqdm import tqdm
 
+from confidence_voters.Util.co_change import CoChange, co_change_location
+from deltaPDG.Util.commit_index import CommitIndex, commit_index_location
 from deltaPDG.Util.git_util import GitUtil
 
 
@@ -27,14 +29,12 @@ def build_corpus(json_location_, subject_location_, temp_dir_):
     file_length_map = defaultdict(lambda: dict())
 
     def worker(work_):
-        git_handler = GitUtil(temp_dir=temp_dir_)
+        git_handler = GitUtil(temp_dir=temp_dir_, worktree=True)
         with git_handler as gh:
-            v1 = gh.move_git_repo_to_tmp(subject_location_)
-            v2 = gh.move_git_repo_to_tmp(subject_location_)
+            v2 = gh.move_git_repo_to_tmp(subject_location_, checkout=False)
             for chain in work_:
                 print('Working on chain: %s' % str(chain))
                 from_ = chain[0]
-                gh.set_git_to_rev(from_ + '^', v1)
                 gh.set_git_to_rev(from_, v2)
 
                 label_changes = dict()
@@ -90,36 +90,52 @@ def diffs_by_file(diff):
     return dict(output)
 
 
-def build_occurrence_matrix(subject_location_, temp_dir_, filter_commits):
-    git_handler = GitUtil(temp_dir=temp_dir_)
-    with git_handler as gh:
-        temp = gh.move_git_repo_to_tmp(subject_location_)
-        candidates = gh.get_all_commit_hashes_authors_dates_messages(temp)
+def build_occurrence_matrix(subject_location_, temp_dir_, filter_commits, index_location=None):
+    """
+    The history is read through the CommitIndex of the subject, shared with tangle_by_file when index_location is
+    where it keeps it.
+    """
+    with CommitIndex(subject_location_, index_location, temp_dir=temp_dir_) as gh:
         all_commits = list()
-        all_files = list()
+        file_index = dict()
         file_commit_map = defaultdict(list)
-        for sha, author, date, msg, diff in candidates:
+        for sha, author, date, msg in gh.candidates():
+            # As when this read the whole log, commits that mention a merge in their message are left out
+            if 'Merge: ' in msg:
+                continue
             if (filter_commits is not None and sha in filter_commits) or filter_commits is None:
                 all_commits.append(sha)
-                files = {fn for _, fn, _, _, _ in diff}
+                # In the order of the index, so the file index does not depend on set ordering
+                files = dict.fromkeys(gh.files(sha))
                 for file in files:
                     file_commit_map[file].append(sha)
-                    if 'file' not in all_files:
-                        all_files.append(file)
+                    file_index.setdefault(file, len(file_index))
 
         file_commit_map = dict(file_commit_map)
 
-        occurrence_matrix_ = generate_occurrence_matrix(all_files, all_commits, file_commit_map)
-        return occurrence_matrix_, {fn: i for i, fn in enumerate(all_files)}
+        occurrence_matrix_ = generate_occurrence_matrix(list(file_index), all_commits, file_commit_map)
+        return occurrence_matrix_, file_index
 
 
 def generate_occurrence_matrix(list_of_files: List[str],
                                list_of_commits: List[str],
                                file_commit_map: Dict[str, List[str]]) -> scipy.sparse.csc_matrix:
-    indices = reduce(lambda p1, p2: (p1[0] + p2[0], p1[1] + p2[1]),
-                     map(lambda p: ([list_of_files.index(p[0])] * len(p[1]),
-                                    [list_of_commits.index(c) for c in p[1]]), file_commit_map.items()), ([], []))
-    return scipy.sparse.csc_matrix(([1] * len(indices[0]), indices), shape=(len(list_of_files), len(list_of_commits)))
+    """
+    files x commits, 1 where a commit touched a file. Repeated (file, commit) pairs add up.
+    """
+    # The first position of a file or commit, as list.index gives
+    file_ids = dict()
+    for i, file in enumerate(list_of_files):
+        file_ids.setdefault(file, i)
+    commit_ids = dict()
+    for i, commit in enumerate(list_of_commits):
+        commit_ids.setdefault(commit, i)
+
+    rows = np.repeat(np.array([file_ids[file] for file in file_commit_map], dtype=np.int64),
+                     [len(commits) for commits in file_commit_map.values()])
+    columns = np.array([commit_ids[c] for commits in file_commit_map.values() for c in commits], dtype=np.int64)
+    return scipy.sparse.coo_matrix((np.ones(len(rows), dtype=np.int64), (rows, columns)),
+                                   shape=(len(list_of_files), len(list_of_commits))).tocsc()
 
 
 if __name__ == '__main__':
@@ -129,10 +145,13 @@ if __name__ == '__main__':
     for repository_name in tqdm(projects):
         json_location = './out/%s/%s_history.json' % (repository_name, repository_name)
         subject_location = './subjects/%s' % repository_name
-        occurrence_matrix, file_index_map = build_occurrence_matrix(subject_location, temp_dir, None)
+        occurrence_matrix, file_index_map = build_occurrence_matrix(
+            subject_location, temp_dir, None, commit_index_location('./out/%s' % repository_name, repository_name))
         with open('./out/%s/file_index.json' % repository_name, 'w') as f:
             f.write(jsonpickle.encode(file_index_map))
         scipy.sparse.save_npz('./out/%s/occurrence_matrix.npz' % repository_name, occurrence_matrix)
+        CoChange.from_occurrence_matrix(occurrence_matrix, file_index_map).save(
+            co_change_location('./out/%s/occurrence_matrix.npz' % repository_name))
         corpus, file_len_map = build_corpus(json_location, subject_location, temp_dir)
         os.makedirs('./out/%s/' % repository_name, exist_ok=True)
         with open('./out/%s/bl_corpus.json' % repository_name, 'w') as f:
@@ -6,9 +6,10 @@ from multiprocessing.pool import ThreadPool
 import networkx as nx
 import numpy as np
 
+from confidence_voters.Util.co_change import CoChange
 from confidence_voters.Util.voter_util import integer_distance_between_intervals, prefix_distance, call_graph_distance, \
     cluster_from_voter_affinity, generate_empty_affinity
-from deltaPDG.Util.pygraph_util import read_graph_from_dot, obj_dict_to_networkx, get_context_from_nxgraph
+from deltaPDG.Util.pygraph_util import read_delta_graph, get_context_from_nxgraph
 
 
 def file_distance(file_length_map):
@@ -69,30 +70,18 @@ def namespace_distance(graph, context):
     return voter
 
 
-def change_coupling(occurrence_matrix, file_index):
+def change_coupling(occurrence_matrix, file_index, co_change=None):
     # Zimmerman et al 2004
     # Given the matrix mapping commits to contains file (We assume this is from the training corpus in our case)
     # Filter to only columns that contain both
     # Sum along rows
     # the coupling is the min / max
+    # The counts for every pair of files come from co_change, computed here when not given
+    if co_change is None:
+        co_change = CoChange.from_occurrence_matrix(occurrence_matrix, file_index)
+
     def voter(diff_region1, diff_region2):
-        file1 = diff_region1['file']
-        file2 = diff_region2['file']
-        selected_idx = list()
-        for i in range(occurrence_matrix.shape[1]):
-            try:
-                if occurrence_matrix[(file_index[file1], i)] and occurrence_matrix[(file_index[file2], i)]:
-                    selected_idx.append(i)
-            except KeyError:
-                pass
-        occurrence_profile = np.squeeze(np.asarray(occurrence_matrix[:, selected_idx].sum(axis=1)))
-        try:
-            file1_count = occurrence_profile[file_index[file1]]
-            file2_count = occurrence_profile[file_index[file2]]
-            return min(file1_count, file2_count) / max(file1_count, file2_count) \
-                if max(file1_count, file2_count) > 0 else .0
-        except KeyError:
-            return .0
+        return co_change.coupling(diff_region1['file'], diff_region2['file'])
 
     return voter
 
@@ -154,7 +143,7 @@ def confidence_aggregator(voters, data):
 
 def cluster_diffs(concepts, data, graph_location, file_length_map, occurrence_matrix, file_index_map, times,
                   edges_kept=None, use_file_dist=True, use_call_distance=True, use_data=True, use_namespace=True,
-                  use_change_coupling=True):
+                  use_change_coupling=True, graph_cache=None, co_change=None):
     """
     :param concepts: The number of concepts we wish to segment
     :param data: The initial diff-regions segmentation, each it's own group
@@ -162,9 +151,11 @@ def cluster_diffs(concepts, data, graph_location, file_length_map, occurrence_ma
     :param file_length_map: A map between filename and file line count
     :param occurrence_matrix: The matrix mapping commits to files and vice versa
     :param file_index_map: The map between filenames and occurrence_matrix indices
+    :param graph_cache: An optional GraphCache used to read graph_location
+    :param co_change: The CoChange counts of occurrence_matrix, computed from it when not given
     :return: The proposed clustering of diff_regions
     """
-    deltaPDG = obj_dict_to_networkx(read_graph_from_dot(graph_location))
+    deltaPDG = read_delta_graph(graph_location, graph_cache)
     if edges_kept is not None:
         deltaPDG = remove_all_except(deltaPDG, edges_kept)
     context = get_context_from_nxgraph(deltaPDG)
@@ -173,7 +164,7 @@ def cluster_diffs(concepts, data, graph_location, file_length_map, occurrence_ma
         call_graph_distance(deltaPDG, context) if use_call_distance else None,
         data_dependency(deltaPDG) if use_data else None,
         namespace_distance(deltaPDG, context) if use_namespace else None,
-        change_coupling(occurrence_matrix, file_index_map) if use_change_coupling else None,
+        change_coupling(occurrence_matrix, file_index_map, co_change) if use_change_coupling else None,
     ]
     voters = [v for v in voters if v is not None]
 
@@ -4,8 +4,8 @@ import time
 from multiprocessing.pool import ThreadPool
 
 import networkx as nx
-import numpy as np
 
+from confidence_voters.Util.co_change import CoChange
 from confidence_voters.Util.voter_util import integer_distance_between_intervals, prefix_distance, call_graph_distance, \
     cluster_from_voter_affinity, generate_empty_affinity
 
@@ -47,30 +47,18 @@ def namespace_distance(context):
     return voter
 
 
-def change_coupling(graph, occurrence_matrix, file_index):
+def change_coupling(graph, occurrence_matrix, file_index, co_change=None):
     # Zimmerman et al 2004
     # Given the matrix mapping commits to contains file (We assume this is from the training corpus in our case)
     # Filter to only columns that contain both
     # Sum along rows
     # the coupling is the min / max
+    # The counts for every pair of files come from co_change, computed here when not given
+    if co_change is None:
+        co_change = CoChange.from_occurrence_matrix(occurrence_matrix, file_index)
+
     def voter(node, other):
-        file1 = graph.nodes[node]['file']
-        file2 = graph.nodes[other]['file']
-        selected_idx = list()
-        for i in range(occurrence_matrix.shape[1]):
-            try:
-                if occurrence_matrix[(file_index[file1], i)] and occurrence_matrix[(file_index[file2], i)]:
-                    selected_idx.append(i)
-            except KeyError:
-                pass
-        occurrence_profile = np.squeeze(np.asarray(occurrence_matrix[:, selected_idx].sum(axis=1)))
-        try:
-            file1_count = occurrence_profile[file_index[file1]]
-            file2_count = occurrence_profile[file_index[file2]]
-            return min(file1_count, file2_count) / max(file1_count, file2_count) \
-                if max(file1_count, file2_count) > 0 else .0
-        except KeyError:
-            return .0
+        return co_change.coupling(graph.nodes[node]['file'], graph.nodes[other]['file'])
 
     return voter
 
@@ -98,7 +86,8 @@ def data_dependency(graph):
     return voter
 
 
-def cluster_diffs(deltaPDG, context, concepts, file_length_map, occurrence_matrix, file_index_map, times):
+def cluster_diffs(deltaPDG, context, concepts, file_length_map, occurrence_matrix, file_index_map, times,
+                  co_change=None):
     """
     :param deltaPDG: The deltaPDG we wish to untangle
     :param context: A mapping from node to method within which it exits
@@ -106,6 +95,7 @@ def cluster_diffs(deltaPDG, context, concepts, file_length_map, occurrence_matri
     :param file_length_map: A map between filename and file line count
     :param occurrence_matrix: The matrix mapping commits to files and vice versa
     :param file_index_map: The map between filenames and occurrence_matrix indices
+    :param co_change: The CoChange counts of occurrence_matrix, computed from it when not given
     :return: The proposed clustering of diff_regions
     """
     try:
@@ -115,6 +105,8 @@ def cluster_diffs(deltaPDG, context, concepts, file_length_map, occurrence_matri
     except ValueError:
         return
     n = len(data)
+    if co_change is None:
+        co_change = CoChange.from_occurrence_matrix(occurrence_matrix, file_index_map)
 
     t0 = time.process_time()
     for i in range(times):
@@ -123,7 +115,7 @@ def cluster_diffs(deltaPDG, context, concepts, file_length_map, occurrence_matri
             call_graph_distance(deltaPDG, context),
             data_dependency(deltaPDG),
             namespace_distance(context),
-            change_coupling(deltaPDG, occurrence_matrix, file_index_map),
+            change_coupling(deltaPDG, occurrence_matrix, file_index_map, co_change),
         ]
         affinity, args = generate_empty_affinity(n, voters)
         with ThreadPool(processes=min(os.cpu_count() - 1, 12)) as wp:
@@ -0,0 +1,220 @@
+"""
+Compact binary storage for deltaPDGs.
+
+A graph is stored as a set of flat numpy arrays in an (uncompressed) .npz file:
+    strings, string_offsets   A shared string table, utf-8 text and character offsets
+    nodes                     String id of every node name, in graph order
+    span_start, span_end      The node span as integers, -1 when the node has no integer span
+    node_attr_names           String id of every node attribute column
+    node_attrs                (columns x nodes) string ids of attribute values, -1 when absent and -2 for a span that
+                              lives in span_start/span_end
+    indptr, indices           CSR adjacency over node positions, edges of a source keep their insertion order
+    edge_keys, edge_key_is_int
+                              String id of every edge key and whether the key was an int
+    edge_order                Insertion rank of every edge, used to restore the original edge order
+    edge_attr_names, edge_attrs
+                              As for nodes, one column per edge attribute
+
+Loading a file gives back the graph that was stored, node, edge and attribute order included.
+"""
+import re
+from collections import deque
+from typing import Dict, List, Tuple
+
+import networkx as nx
+import numpy as np
+
+BINARY_SUFFIX = '.npz'
+
+_SPAN = re.compile(r'^(\d+)-(\d+)$')
+_INT32_MAX = np.iinfo(np.int32).max
+
+
+class StringTable(object):
+    """
+    Interns strings and serialises them as one utf-8 blob with character offsets.
+    """
+
+    def __init__(self, strings: List[str] = None):
+        self.strings = list() if strings is None else strings
+        self.index = {s: i for i, s in enumerate(self.strings)}
+
+    def intern(self, string: str) -> int:
+        try:
+            return self.index[string]
+        except KeyError:
+            if not isinstance(string, str):
+                raise TypeError('Only string attributes can be stored, got %r' % (string,))
+            self.index[string] = len(self.strings)
+            self.strings.append(string)
+            return len(self.strings) - 1
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        offsets = np.zeros(len(self.strings) + 1, dtype=np.int64)
+        np.cumsum([len(s) for s in self.strings], out=offsets[1:])
+        text = ''.join(self.strings).encode('utf-8', 'surrogatepass')
+        return {'strings': np.frombuffer(text, dtype=np.uint8), 'string_offsets': offsets}
+
+    @staticmethod
+    def from_arrays(strings: np.ndarray, string_offsets: np.ndarray) -> 'StringTable':
+        text = strings.tobytes().decode('utf-8', 'surrogatepass')
+        offsets = string_offsets.tolist()
+        return StringTable([text[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)])
+
+
+def _int_span(span):
+    # Only spans that are written back the same, e.g. not 01-3, and fit the int32 columns
+    match = _SPAN.match(span) if isinstance(span, str) else None
+    if match is None:
+        return None
+    start, end = int(match.group(1)), int(match.group(2))
+    if start <= _INT32_MAX and end <= _INT32_MAX and '%d-%d' % (start, end) == span:
+        return start, end
+    return None
+
+
+def _attribute_columns(items, strings: StringTable, size: int, span: bool = False):
+    columns = dict()
+    for position, attributes in enumerate(items):
+        for key, value in attributes.items():
+            try:
+                column = columns[key]
+            except KeyError:
+                column = columns[key] = np.full(size, -1, dtype=np.int32)
+            if span and key == 'span' and _int_span(value) is not None:
+                column[position] = -2
+            else:
+                column[position] = strings.intern(value)
+    names = np.asarray([strings.intern(k) for k in columns.keys()], dtype=np.int32)
+    values = np.stack(list(columns.values())) if columns else np.zeros((0, size), dtype=np.int32)
+    return names, values
+
+
+def _insertion_order(graph: nx.MultiDiGraph, edges) -> np.ndarray:
+    # networkx only remembers the order of successors and of predecessors per node, any edge order that agrees with
+    # both rebuilds the same adjacency, so topologically sort the node pairs under those two orders.
+    pair_id = dict()
+    for s, t, _, _ in edges:
+        if (s, t) not in pair_id:
+            pair_id[(s, t)] = len(pair_id)
+    follows = [list() for _ in range(len(pair_id))]
+    waiting = [0] * len(pair_id)
+    for neighbours in (graph.succ, graph.pred):
+        for node, adjacent in neighbours.items():
+            previous = None
+            for other in adjacent:
+                current = pair_id[(node, other) if neighbours is graph.succ else (other, node)]
+                if previous is not None:
+                    follows[previous].append(current)
+                    waiting[current] += 1
+                previous = current
+    rank = [0] * len(pair_id)
+    ready = deque(i for i in range(len(pair_id)) if waiting[i] == 0)
+    next_rank = 0
+    while ready:
+        current = ready.popleft()
+        rank[current] = next_rank
+        next_rank += 1
+        for other in follows[current]:
+            waiting[other] -= 1
+            if waiting[other] == 0:
+                ready.append(other)
+    # Edges between the same pair share one key dictionary, so they keep their relative order
+    return np.argsort(np.asarray([rank[pair_id[(s, t)]] for s, t, _, _ in edges], dtype=np.int64), kind='stable')
+
+
+def graph_to_arrays(graph: nx.MultiDiGraph, strings: StringTable) -> Dict[str, np.ndarray]:
+    """
+    Flatten a deltaPDG into arrays, interning all strings into the given table.
+    """
+    position = {n: i for i, n in enumerate(graph.nodes)}
+    nodes = np.asarray([strings.intern(n) for n in graph.nodes], dtype=np.int32)
+
+    span_start = np.full(len(nodes), -1, dtype=np.int32)
+    span_end = np.full(len(nodes), -1, dtype=np.int32)
+    for i, (_, data) in enumerate(graph.nodes(data=True)):
+        span = _int_span(data.get('span'))
+        if span is not None:
+            span_start[i], span_end[i] = span
+    node_attr_names, node_attrs = _attribute_columns((d for _, d in graph.nodes(data=True)), strings, len(nodes),
+                                                     span=True)
+
+    edges = list(graph.edges(keys=True, data=True))
+    insertion = _insertion_order(graph, edges)
+    edge_order = np.empty(len(edges), dtype=np.int32)
+    edge_order[insertion] = np.arange(len(edges), dtype=np.int32)
+    sources = np.asarray([position[s] for s, _, _, _ in edges], dtype=np.int64)
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=len(nodes)), out=indptr[1:])
+    indices = np.asarray([position[t] for _, t, _, _ in edges], dtype=np.int32)
+    edge_keys = np.asarray([strings.intern(str(k)) for _, _, k, _ in edges], dtype=np.int32)
+    edge_key_is_int = np.asarray([isinstance(k, int) for _, _, k, _ in edges], dtype=bool)
+    edge_attr_names, edge_attrs = _attribute_columns((d for _, _, _, d in edges), strings, len(edges))
+
+    return {
+        'nodes': nodes,
+        'span_start': span_start,
+        'span_end': span_end,
+        'node_attr_names': node_attr_names,
+        'node_attrs': node_attrs,
+        'indptr': indptr,
+        'indices': indices,
+        'edge_keys': edge_keys,
+        'edge_key_is_int': edge_key_is_int,
+        'edge_order': edge_order,
+        'edge_attr_names': edge_attr_names,
+        'edge_attrs': edge_attrs,
+    }
+
+
+def _attribute_dicts(names: np.ndarray, values: np.ndarray, strings: List[str]) -> List[Dict[str, str]]:
+    keys = [strings[k] for k in names.tolist()]
+    result = [dict() for _ in range(values.shape[1])]
+    for key, column in zip(keys, values.tolist()):
+        for position, value in enumerate(column):
+            if value != -1:
+                result[position][key] = strings[value] if value >= 0 else None
+    return result
+
+
+def arrays_to_graph(arrays, strings: List[str]) -> nx.MultiDiGraph:
+    """
+    Rebuild the networkx graph from the arrays produced by graph_to_arrays.
+    """
+    names = [strings[n] for n in arrays['nodes'].tolist()]
+    node_data = _attribute_dicts(arrays['node_attr_names'], arrays['node_attrs'], strings)
+    for data, start, end in zip(node_data, arrays['span_start'].tolist(), arrays['span_end'].tolist()):
+        if data.get('span', '') is None:
+            data['span'] = '%d-%d' % (start, end)
+
+    indptr = arrays['indptr']
+    sources = np.repeat(np.arange(len(names)), np.diff(indptr)).tolist()
+    targets = arrays['indices'].tolist()
+    keys = [int(strings[k]) if is_int else strings[k]
+            for k, is_int in zip(arrays['edge_keys'].tolist(), arrays['edge_key_is_int'].tolist())]
+    edge_data = _attribute_dicts(arrays['edge_attr_names'], arrays['edge_attrs'], strings)
+    insertion = np.argsort(arrays['edge_order'], kind='stable').tolist()
+
+    graph = nx.MultiDiGraph()
+    graph.add_nodes_from(zip(names, node_data))
+    graph.add_edges_from((names[sources[i]], names[targets[i]], keys[i], edge_data[i]) for i in insertion)
+    return graph
+
+
+def write_binary_graph(graph: nx.MultiDiGraph, location: str):
+    strings = StringTable()
+    arrays = graph_to_arrays(graph, strings)
+    arrays.update(strings.to_arrays())
+    with open(location, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+def read_binary_graph_arrays(location: str) -> Tuple[Dict[str, np.ndarray], List[str]]:
+    with np.load(location) as arrays:
+        arrays = dict(arrays)
+    strings = StringTable.from_arrays(arrays.pop('strings'), arrays.pop('string_offsets')).strings
+    return arrays, strings
+
+
+def read_binary_graph(location: str) -> nx.MultiDiGraph:
+    return arrays_to_graph(*read_binary_graph_arrays(location))
@@ -0,0 +1,229 @@
+"""
+The commit history of a repository read in a single git log pass, so that per-commit queries need no git process.
+
+Kept under out/<project>/ as a columnar .npz, in the string table layout of deltaPDG/Util/binary_graph.py:
+    strings, string_offsets   Shared string table of shas, author names, dates, messages and file names
+    sha, author, date, message
+                              String id of each field of every commit, oldest commit first
+    parents, parent_offsets   String ids of the parents of every commit, those of commit i are
+                              parents[parent_offsets[i]:parent_offsets[i + 1]]
+    files, file_offsets       String ids of the files every commit changed lines of, laid out as the parents
+    tips                      String ids of the branch heads the history was read up to
+    version                   INDEX_VERSION of the layout and file naming; an index of another version is read anew
+"""
+import datetime
+import logging
+import os
+import subprocess
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from deltaPDG.Util.binary_graph import StringTable
+from deltaPDG.Util.git_util import GitUtil
+
+# One record per commit: sha, parents, author, ISO author date and message, followed by the --numstat of its files
+_LOG_FORMAT = '%x1e%H%x1f%P%x1f%aN%x1f%aI%x1f%B%x1f'
+
+# Bumped whenever the stored layout or the naming of files changes, 2 names files as FileDiffParser does
+INDEX_VERSION = 2
+
+# Escapes of git's C-style quoting of paths, other bytes that need quoting are written in octal
+_QUOTE_ESCAPES = {0x07: 'a', 0x08: 'b', 0x09: 't', 0x0a: 'n', 0x0b: 'v', 0x0c: 'f', 0x0d: 'r', 0x22: '"', 0x5c: '\\'}
+
+
+def _diff_name(path: bytes, quote_path: bool = True) -> str:
+    """
+    The name FileDiffParser gives the file at path, taken from git's '--- a/path' line: /path, or "/path" with C-style
+    escapes when git quotes it, followed by a tab when the path holds a space.
+    """
+    if any(b < 0x20 or b in (0x22, 0x5c, 0x7f) or (quote_path and b >= 0x80) for b in path):
+        name = '"/%s"' % ''.join('\\' + _QUOTE_ESCAPES[b] if b in _QUOTE_ESCAPES
+                                 else '\\%03o' % b if b < 0x20 or b >= 0x7f else chr(b) for b in path)
+    else:
+        name = '/' + path.decode('utf-8', 'replace')
+    return name + '\t' if b' ' in path else name
+
+
+def _diff_names(numstat: bytes, quote_path: bool = True) -> List[str]:
+    """
+    The files of git log --numstat -z output that FileDiffParser finds changes for in the diff: no binary files, no
+    renames or mode changes that leave the lines as they are, and renamed files under the name they had before.
+    """
+    fields = numstat.lstrip(b'\0\n').split(b'\0')
+    names = list()
+    i = 0
+    while i < len(fields):
+        if not fields[i]:
+            i += 1
+            continue
+        added, deleted, path = fields[i].split(b'\t', 2)
+        if path:
+            i += 1
+        else:
+            # A rename, the old and the new path follow
+            path = fields[i + 1]
+            i += 3
+        if added != b'-' and (added, deleted) != (b'0', b'0'):
+            names.append(_diff_name(path, quote_path))
+    return names
+
+
+def _offsets(lengths: List[int]) -> np.ndarray:
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+class CommitIndex(GitUtil):
+    """
+    sha -> author, author date, message, parents and touched files of every commit on a branch of repository.
+
+    Can stand in for GitUtil: get_author, get_commit_msg and get_time_between_commits are lookups for indexed commits
+    and fall back to git for anything else, e.g. sha^. When given a location the index is kept there and only commits
+    that are new since the last run are read and appended.
+    """
+
+    def __init__(self, repository: str, location: Optional[str] = None, temp_dir: Optional[str] = None):
+        super(CommitIndex, self).__init__(temp_dir)
+        self.repository = repository
+        self.location = location
+        # In git log --reverse order, oldest first
+        self.commits = dict()
+        self.tips = list()
+        if location is not None and os.path.exists(location):
+            self.load()
+        self.refresh()
+
+    def refresh(self) -> int:
+        """
+        Append the commits reachable from a branch that are not indexed yet. When a branch was rewritten or deleted
+        since, the commits that are no longer reachable from any branch are dropped first.
+
+        :return: The number of commits added
+        """
+        tips = self.get_branch_tips(self.repository)
+        if tips == self.tips or not tips:
+            return 0
+        known = [t for t in self.tips if t in tips]
+        if len(known) < len(self.tips):
+            reachable = set(subprocess.run(['git', 'rev-list', '--branches=*'], cwd=self.repository,
+                                           stdout=subprocess.PIPE, check=True).stdout.decode('utf-8').split())
+            dropped = len(self.commits)
+            self.commits = {sha: commit for sha, commit in self.commits.items() if sha in reachable}
+            dropped -= len(self.commits)
+            if dropped > 0:
+                logging.info(f"Dropped {dropped} commits of {self.repository} that are no longer on a branch")
+            known = [t for t in self.tips if t in reachable]
+        # Only the line counts of the files are read, their names are made up as FileDiffParser reads them from a diff
+        command = ['git', 'log', '--branches=*', '--reverse', '--numstat', '-z', '--format=' + _LOG_FORMAT]
+        if known:
+            command += ['--not'] + known
+        output = subprocess.run(command, cwd=self.repository, stdout=subprocess.PIPE, check=True).stdout
+        quote_path = subprocess.run(['git', 'config', '--bool', 'core.quotePath'], cwd=self.repository,
+                                    stdout=subprocess.PIPE).stdout.strip() != b'false'
+        new = 0
+        for record in output.split(b'\x1e')[1:]:
+            fields = record.split(b'\x1f', 5)
+            sha, parents, author, date, message = (f.decode('utf-8', 'replace') for f in fields[:5])
+            if sha not in self.commits:
+                new += 1
+            self.commits[sha] = {'author': author,
+                                 'date': date,
+                                 'message': message,
+                                 'parents': parents.split(),
+                                 'files': _diff_names(fields[5], quote_path)}
+        self.tips = tips
+        if self.location is not None:
+            self.save()
+        return new
+
+    def load(self):
+        with np.load(self.location) as arrays:
+            arrays = dict(arrays)
+        if 'version' not in arrays or int(arrays['version']) != INDEX_VERSION:
+            logging.info(f"Reading the history of {self.repository} anew, the index at {self.location} is outdated")
+            return
+        strings = StringTable.from_arrays(arrays['strings'], arrays['string_offsets']).strings
+        parents = [strings[p] for p in arrays['parents'].tolist()]
+        parent_offsets = arrays['parent_offsets'].tolist()
+        files = [strings[f] for f in arrays['files'].tolist()]
+        file_offsets = arrays['file_offsets'].tolist()
+        columns = zip(arrays['sha'].tolist(), arrays['author'].tolist(), arrays['date'].tolist(),
+                      arrays['message'].tolist())
+        self.commits = {strings[sha]: {'author': strings[author],
+                                       'date': strings[date],
+                                       'message': strings[message],
+                                       'parents': parents[parent_offsets[i]:parent_offsets[i + 1]],
+                                       'files': files[file_offsets[i]:file_offsets[i + 1]]}
+                        for i, (sha, author, date, message) in enumerate(columns)}
+        self.tips = [strings[t] for t in arrays['tips'].tolist()]
+
+    def save(self):
+        strings = StringTable()
+        commits = list(self.commits.items())
+        arrays = {
+            'sha': np.array([strings.intern(sha) for sha, _ in commits], dtype=np.int32),
+            'author': np.array([strings.intern(c['author']) for _, c in commits], dtype=np.int32),
+            'date': np.array([strings.intern(c['date']) for _, c in commits], dtype=np.int32),
+            'message': np.array([strings.intern(c['message']) for _, c in commits], dtype=np.int32),
+            'parents': np.array([strings.intern(p) for _, c in commits for p in c['parents']], dtype=np.int32),
+            'parent_offsets': _offsets([len(c['parents']) for _, c in commits]),
+            'files': np.array([strings.intern(f) for _, c in commits for f in c['files']], dtype=np.int32),
+            'file_offsets': _offsets([len(c['files']) for _, c in commits]),
+            'tips': np.array([strings.intern(t) for t in self.tips], dtype=np.int32),
+            'version': np.array(INDEX_VERSION),
+        }
+        arrays.update(strings.to_arrays())
+        os.makedirs(os.path.dirname(os.path.abspath(self.location)), exist_ok=True)
+        temp = '%s.%d.tmp' % (self.location, os.getpid())
+        with open(temp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temp, self.location)
+
+    def __contains__(self, sha: str) -> bool:
+        return sha in self.commits
+
+    def author(self, sha: str) -> str:
+        return self.commits[sha]['author']
+
+    def date(self, sha: str) -> datetime.datetime:
+        return datetime.datetime.fromisoformat(self.commits[sha]['date'])
+
+    def message(self, sha: str) -> str:
+        return self.commits[sha]['message']
+
+    def parents(self, sha: str) -> List[str]:
+        return self.commits[sha]['parents']
+
+    def files(self, sha: str) -> List[str]:
+        return self.commits[sha]['files']
+
+    def candidates(self) -> List[Tuple[str, str, datetime.datetime, str]]:
+        """
+        (sha, author, date, message) of every commit that is not a merge, oldest first like git log --reverse.
+        """
+        return [(sha, commit['author'], datetime.datetime.fromisoformat(commit['date']), commit['message'])
+                for sha, commit in self.commits.items() if len(commit['parents']) <= 1]
+
+    def get_author(self, sha: str, path: str) -> str:
+        if sha in self.commits:
+            return self.commits[sha]['author']
+        return GitUtil.get_author(sha, path)
+
+    def get_commit_msg(self, sha: str, path: str) -> str:
+        if sha in self.commits:
+            return self.commits[sha]['message']
+        return GitUtil.get_commit_msg(sha, path)
+
+    def get_time_between_commits(self, old: str, new: str, path: str) -> datetime.timedelta:
+        if old in self.commits and new in self.commits:
+            return self.date(new) - self.date(old)
+        return GitUtil.get_time_between_commits(old, new, path)
+
+    def get_all_commit_hashes(self, path: str = None) -> List[str]:
+        return list(self.commits.keys())
+
+
+def commit_index_location(output_dir: str, repository_name: str) -> str:
+    return os.path.join(output_dir, '{}_commit_index.npz'.format(repository_name))
@@ -0,0 +1,169 @@
+"""
+A project's deltaPDGs packed into one memory-mapped archive.
+
+The archive holds the arrays of binary_graph.py for every datapoint, all sharing a single string table:
+    magic                     b'FLXSTORE'
+    segments                  Raw array data, each segment aligned to 16 bytes
+    index                     utf-8 JSON with the string table segments and, per datapoint, its chain, number of
+                              concepts, original graph location and the segment of every array
+    index offset              little-endian uint64 offset of the index
+
+Arrays are handed out as read-only views on the mapping, so worker processes that open the same store share its pages
+instead of each holding their own copies.
+"""
+import json
+import mmap
+import os
+from typing import Dict, Iterable, List, Tuple
+
+import networkx as nx
+import numpy as np
+
+from deltaPDG.Util.binary_graph import StringTable, arrays_to_graph, graph_to_arrays
+from deltaPDG.Util.delta_graph import DeltaGraph
+
+CORPUS_STORE_SUFFIX = '.store'
+
+_MAGIC = b'FLXSTORE'
+_ALIGNMENT = 16
+
+
+def corpus_store_location(repository_name: str) -> str:
+    return os.path.join('.', 'data', 'corpora_clean', repository_name + CORPUS_STORE_SUFFIX)
+
+
+class CorpusEntry(object):
+    """
+    A single datapoint of a CorpusStore, the graph is only built when load is called.
+    """
+
+    def __init__(self, store: 'CorpusStore', chain: str, q: int, location: str):
+        self.store = store
+        self.chain = chain
+        self.q = q
+        self.location = location
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return self.store.arrays(self.chain, self.q)
+
+    def load(self) -> nx.MultiDiGraph:
+        return self.store.graph(self.chain, self.q)
+
+    def load_delta_graph(self) -> DeltaGraph:
+        return self.store.delta_graph(self.chain, self.q)
+
+    def __repr__(self):
+        return 'CorpusEntry(%s, %d)' % (self.chain, self.q)
+
+
+class CorpusStore(object):
+    """
+    Read-only access to an archive written by write_corpus_store.
+    """
+
+    def __init__(self, location: str):
+        self.location = location
+        self._map = None
+        self._strings = None
+        with open(location, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError('%s is not a corpus store' % location)
+            f.seek(-8, os.SEEK_END)
+            index_offset = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+            f.seek(index_offset)
+            index = json.loads(f.read()[:-8].decode('utf-8'))
+        self._string_segments = index['strings']
+        self._segments = dict()
+        self._entries = dict()
+        for chain, q, graph_location, segments in index['datapoints']:
+            self._segments[(chain, q)] = segments
+            self._entries[(chain, q)] = CorpusEntry(self, chain, q, graph_location)
+
+    def __getstate__(self):
+        # The mapping is reopened by every process the store is sent to
+        state = self.__dict__.copy()
+        state['_map'] = None
+        state['_strings'] = None
+        return state
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Tuple[str, int]):
+        return key in self._segments
+
+    def __iter__(self):
+        return iter(self._entries.values())
+
+    def entries(self) -> List[CorpusEntry]:
+        return list(self._entries.values())
+
+    def entry(self, chain: str, q: int) -> CorpusEntry:
+        return self._entries[(chain, q)]
+
+    def _segment(self, segment) -> np.ndarray:
+        if self._map is None:
+            with open(self.location, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        offset, dtype, shape = segment
+        count = int(np.prod(shape, dtype=np.int64))
+        return np.frombuffer(self._map, dtype=dtype, count=count, offset=offset).reshape(shape)
+
+    @property
+    def strings(self) -> List[str]:
+        if self._strings is None:
+            self._strings = StringTable.from_arrays(self._segment(self._string_segments['strings']),
+                                                    self._segment(self._string_segments['string_offsets'])).strings
+        return self._strings
+
+    def arrays(self, chain: str, q: int) -> Dict[str, np.ndarray]:
+        return {name: self._segment(segment) for name, segment in self._segments[(chain, q)].items()}
+
+    def graph(self, chain: str, q: int) -> nx.MultiDiGraph:
+        return arrays_to_graph(self.arrays(chain, q), self.strings)
+
+    def delta_graph(self, chain: str, q: int) -> DeltaGraph:
+        return DeltaGraph(self.arrays(chain, q), self.strings)
+
+
+def _write_segment(f, array: np.ndarray):
+    padding = -f.tell() % _ALIGNMENT
+    f.write(b'\0' * padding)
+    offset = f.tell()
+    array = np.ascontiguousarray(array)
+    f.write(array.tobytes())
+    return [offset, array.dtype.str, list(array.shape)]
+
+
+def write_corpus_store(datapoints: Iterable[Tuple[str, int, str, nx.MultiDiGraph]], location: str) -> int:
+    """
+    Pack datapoints, given as (chain, q, graph location, graph), into a single archive.
+    :return: The number of datapoints written
+    """
+    strings = StringTable()
+    index = {'datapoints': list()}
+    with open(location + '.tmp', 'wb') as f:
+        f.write(_MAGIC)
+        for chain, q, graph_location, graph in datapoints:
+            arrays = graph_to_arrays(graph, strings)
+            segments = {name: _write_segment(f, array) for name, array in arrays.items()}
+            index['datapoints'].append([chain, q, graph_location, segments])
+        index['strings'] = {name: _write_segment(f, array) for name, array in strings.to_arrays().items()}
+        index_offset = f.tell()
+        f.write(json.dumps(index).encode('utf-8'))
+        f.write(np.asarray([index_offset], dtype='<u8').tobytes())
+    os.replace(location + '.tmp', location)
+    return len(index['datapoints'])
+
+
+def datapoint_of(item) -> Tuple[str, int]:
+    """
+    The (chain, number of concepts) pair of a graph location or CorpusEntry.
+    """
+    if isinstance(item, CorpusEntry):
+        return item.chain, item.q
+    return os.path.basename(os.path.dirname(os.path.dirname(item))), int(os.path.basename(os.path.dirname(item)))
+
+
+def graph_location_of(item) -> str:
+    return item.location if isinstance(item, CorpusEntry) else item
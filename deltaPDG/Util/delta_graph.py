@@ -0,0 +1,170 @@
+"""
+An array backed deltaPDG.
+
+DeltaGraph holds the same information as the networkx MultiDiGraph read_delta_graph returns, laid out in the arrays of
+binary_graph.py instead of per node and per edge dictionaries:
+    node_ids                  String id of every node name
+    span_start, span_end      int32 spans, -1 when the node has no integer span
+    node_columns              Per attribute, the string id of every node's value (-1 when absent), so categorical
+                              attributes such as color, cluster, file and community are codes into the string table
+    src, dst, indptr          Edges in CSR order, the out-edges of node i are indptr[i]:indptr[i + 1]
+    in_indptr, in_edges       The same edges grouped by target (CSC), in networkx' predecessor order
+    edge_keys, edge_columns   Edge keys and attributes as string ids
+
+Algorithms can keep using networkx through to_networkx, while hot paths work on the arrays directly.
+"""
+from typing import Dict, List, Tuple
+
+import networkx as nx
+import numpy as np
+
+from deltaPDG.Util.binary_graph import StringTable, arrays_to_graph, graph_to_arrays, read_binary_graph_arrays
+
+
+class DeltaGraph(object):
+    """
+    An immutable deltaPDG backed by numpy arrays, nodes and edges are addressed by their position.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], strings: List[str]):
+        self.arrays = arrays
+        self.strings = strings
+        self.node_ids = arrays['nodes']
+        self.span_start = arrays['span_start']
+        self.span_end = arrays['span_end']
+        self.node_columns = {strings[k]: column
+                             for k, column in zip(arrays['node_attr_names'].tolist(), arrays['node_attrs'])}
+
+        self.indptr = arrays['indptr']
+        self.dst = arrays['indices']
+        self.src = np.repeat(np.arange(len(self.node_ids), dtype=np.int32), np.diff(self.indptr))
+        self.edge_keys = arrays['edge_keys']
+        self.edge_columns = {strings[k]: column
+                             for k, column in zip(arrays['edge_attr_names'].tolist(), arrays['edge_attrs'])}
+
+        # Predecessors come in the order their first edge was inserted, as in networkx
+        self.in_edges = np.lexsort((arrays['edge_order'], self.dst)).astype(np.int32)
+        self.in_indptr = np.zeros(len(self.node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.dst, minlength=len(self.node_ids)), out=self.in_indptr[1:])
+
+        self._names = None
+        self._index = None
+        self._categories = dict()
+
+    @staticmethod
+    def from_networkx(graph: nx.MultiDiGraph) -> 'DeltaGraph':
+        strings = StringTable()
+        arrays = graph_to_arrays(graph, strings)
+        return DeltaGraph(arrays, strings.strings)
+
+    def to_networkx(self) -> nx.MultiDiGraph:
+        return arrays_to_graph(self.arrays, self.strings)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self.arrays.values()) + self.src.nbytes + self.in_edges.nbytes \
+               + self.in_indptr.nbytes
+
+    def number_of_nodes(self) -> int:
+        return len(self.node_ids)
+
+    def number_of_edges(self) -> int:
+        return len(self.dst)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    @property
+    def names(self) -> List[str]:
+        if self._names is None:
+            self._names = [self.strings[n] for n in self.node_ids.tolist()]
+        return self._names
+
+    def index(self, name: str) -> int:
+        if self._index is None:
+            self._index = {n: i for i, n in enumerate(self.names)}
+        return self._index[name]
+
+    def attribute(self, node: int, attribute: str, default=None):
+        if attribute == 'span' and self.span_start[node] >= 0:
+            return '%d-%d' % (self.span_start[node], self.span_end[node])
+        try:
+            value = self.node_columns[attribute][node]
+        except KeyError:
+            return default
+        return default if value < 0 else self.strings[value]
+
+    def node_data(self, node: int) -> Dict[str, str]:
+        return {k: self.attribute(node, k) for k, column in self.node_columns.items() if column[node] != -1}
+
+    def has_attribute(self, attribute: str) -> np.ndarray:
+        """
+        Boolean mask of the nodes that carry attribute.
+        """
+        try:
+            return self.node_columns[attribute] != -1
+        except KeyError:
+            return np.zeros(len(self.node_ids), dtype=bool)
+
+    def categorical(self, attribute: str) -> Tuple[np.ndarray, List[str]]:
+        """
+        Dense codes (-1 when absent) and the matching categories of a node attribute, e.g. color or community.
+        """
+        try:
+            return self._categories[attribute]
+        except KeyError:
+            pass
+        column = self.node_columns.get(attribute, np.full(len(self.node_ids), -1, dtype=np.int32))
+        present = column >= 0
+        levels, codes = np.unique(column[present], return_inverse=True)
+        dense = np.full(len(column), -1, dtype=np.int32)
+        dense[present] = codes
+        result = (dense, [self.strings[k] for k in levels.tolist()])
+        self._categories[attribute] = result
+        return result
+
+    def edge_key(self, edge: int):
+        key = self.strings[self.edge_keys[edge]]
+        return int(key) if self.arrays['edge_key_is_int'][edge] else key
+
+    def out_edges(self, node: int) -> np.ndarray:
+        return np.arange(self.indptr[node], self.indptr[node + 1])
+
+    def in_edges_of(self, node: int) -> np.ndarray:
+        return self.in_edges[self.in_indptr[node]:self.in_indptr[node + 1]]
+
+    def successors(self, node: int) -> np.ndarray:
+        targets = self.dst[self.indptr[node]:self.indptr[node + 1]]
+        return _unique_in_order(targets)
+
+    def predecessors(self, node: int) -> np.ndarray:
+        return _unique_in_order(self.src[self.in_edges_of(node)])
+
+    def has_edge(self, source: int, target: int, key=None) -> bool:
+        edges = self.out_edges(source)
+        edges = edges[self.dst[edges] == target]
+        if key is None:
+            return len(edges) > 0
+        return any(self.edge_key(e) == key for e in edges.tolist())
+
+    def edges_with_key(self, key: str) -> np.ndarray:
+        """
+        Positions of the edges with the given key, e.g. '1' for data-flow edges.
+        """
+        codes = [c for c in np.unique(self.edge_keys).tolist() if self.strings[c] == key]
+        if not codes:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(self.edge_keys == codes[0])
+
+
+def _unique_in_order(positions: np.ndarray) -> np.ndarray:
+    _, first = np.unique(positions, return_index=True)
+    return positions[np.sort(first)]
+
+
+def read_delta_graph_arrays(location: str) -> DeltaGraph:
+    """
+    Read a graph written by write_binary_graph straight into a DeltaGraph.
+    """
+    arrays, strings = read_binary_graph_arrays(location)
+    return DeltaGraph(arrays, strings)
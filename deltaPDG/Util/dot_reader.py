@@ -0,0 +1,178 @@
+"""
+A single pass reader for the subset of DOT emitted by the PDG extractors and by networkx' write_dot.
+
+The result mirrors obj_dict_to_networkx(read_graph_from_dot(...)): only the first declaration of a node, the first
+edge between an ordered pair of nodes and the first definition of a subgraph are kept, nodes without a span are
+dropped, nodes of top-level subgraphs get the subgraph label as their cluster and surrounding quotes are removed from
+attribute values (escape sequences are kept verbatim, as pydot does). Input pydot rejects, such as ; between attributes
+or a negative numeral as node ID, raises ValueError. Ports, a:p or a:p:n, are dropped from edge ends as well as from
+node statements, where pydot would make a node of a:p out of an edge end.
+"""
+import re
+from typing import Dict, List, Tuple
+
+import networkx as nx
+
+_TOKENS = re.compile(r'''
+    (?:\s+|//[^\n]*|/\*.*?\*/|^\#[^\n]*)      # whitespace, comments and preprocessor lines are skipped
+    |("(?:[^"\\]|\\.)*"                       # quoted IDs, kept verbatim
+     |->|--
+     |[{}\[\];,=]
+     |-?[\w.\x80-\uffff]+                     # plain IDs and numerals
+     |\S)                                     # anything else is reported by the parser
+''', re.VERBOSE | re.DOTALL | re.MULTILINE)
+
+
+class _Scope(object):
+    __slots__ = ('nodes', 'edges', 'subgraphs', 'attributes', 'graph_stmt')
+
+    def __init__(self):
+        self.nodes = dict()
+        self.edges = dict()
+        self.subgraphs = dict()
+        self.attributes = dict()
+        self.graph_stmt = None
+
+
+def _check_id(token: str) -> str:
+    if token[0] == '"' or token[0] == '-' or token[0] == '.' or token[0].isalnum() or token[0] == '_' \
+            or token[0] >= '\x80':
+        return token
+    raise ValueError('Unexpected token %r' % token)
+
+
+def _parse_attributes(tokens: List[str], i: int) -> Tuple[Dict[str, str], int]:
+    attributes = dict()
+    while tokens[i] == '[':
+        i += 1
+        while tokens[i] != ']':
+            if tokens[i + 1] != '=':
+                raise ValueError('Attribute %r has no value' % tokens[i])
+            attributes[_check_id(tokens[i])] = _check_id(tokens[i + 2])
+            i += 3
+            if tokens[i] == ',':
+                i += 1
+            elif tokens[i] == ';':
+                raise ValueError('Attributes separated by ;')
+        i += 1
+    return attributes, i
+
+
+def _node_id(tokens: List[str], i: int) -> Tuple[str, int]:
+    node = _check_id(tokens[i])
+    if node[0] == '-':
+        raise ValueError('Negative numeral %r as node ID' % node)
+    i += 1
+    # The port and compass point only name a position on the node
+    while tokens[i] == ':':
+        _check_id(tokens[i + 1])
+        i += 2
+    return node, i
+
+
+def _parse_statements(tokens: List[str], i: int, scope: _Scope) -> int:
+    while True:
+        token = tokens[i]
+        if token == '}':
+            return i + 1
+        if token == ';':
+            i += 1
+            continue
+        keyword = token.lower()
+
+        if keyword == 'subgraph' or token == '{':
+            name = ''
+            if keyword == 'subgraph':
+                i += 1
+                if tokens[i] != '{':
+                    name = _check_id(tokens[i])
+                    i += 1
+            if tokens[i] != '{':
+                raise ValueError('Expected { after subgraph %s' % name)
+            subgraph = _Scope()
+            i = _parse_statements(tokens, i + 1, subgraph)
+            if tokens[i] == '->' or tokens[i] == '--':
+                raise ValueError('Edges from subgraphs are not supported')
+            scope.subgraphs.setdefault(name, subgraph)
+            continue
+
+        if keyword in ('graph', 'node', 'edge') and tokens[i + 1] == '[':
+            # Node and edge defaults are not applied, as pydot leaves them out of the obj_dict too
+            attributes, i = _parse_attributes(tokens, i + 1)
+            if keyword == 'graph' and scope.graph_stmt is None:
+                scope.graph_stmt = attributes
+            continue
+
+        _check_id(token)
+        if tokens[i + 1] == '=':
+            scope.attributes[token] = _check_id(tokens[i + 2])
+            i += 3
+            continue
+
+        node, i = _node_id(tokens, i)
+        ends = [node]
+        while tokens[i] == '->' or tokens[i] == '--':
+            node, i = _node_id(tokens, i + 1)
+            ends.append(node)
+        attributes = dict()
+        if tokens[i] == '[':
+            attributes, i = _parse_attributes(tokens, i)
+
+        if len(ends) == 1:
+            if node not in scope.nodes:
+                scope.nodes[node] = attributes
+        else:
+            for source, target in zip(ends, ends[1:]):
+                if (source, target) not in scope.edges:
+                    scope.edges[(source, target)] = attributes
+
+
+def _unquote(attributes: Dict[str, str]) -> Dict[str, str]:
+    return {k: v[1:-1] if v[0] == v[-1] == '"' else v for k, v in attributes.items()}
+
+
+def parse_dot(text: str) -> nx.MultiDiGraph:
+    """
+    Parse the first graph in a DOT document into a MultiDiGraph, raises ValueError on malformed input.
+    """
+    tokens = [t for t in _TOKENS.findall(text) if t]
+    i = 0
+    try:
+        if tokens[i].lower() == 'strict':
+            i += 1
+        if tokens[i].lower() not in ('graph', 'digraph'):
+            raise ValueError('Expected graph or digraph, found %r' % tokens[i])
+        i += 1
+        if tokens[i] != '{':
+            _check_id(tokens[i])
+            i += 1
+        if tokens[i] != '{':
+            raise ValueError('Expected {, found %r' % tokens[i])
+        root = _Scope()
+        _parse_statements(tokens, i + 1, root)
+    except IndexError:
+        raise ValueError('Unexpected end of file')
+
+    graph = nx.MultiDiGraph()
+    for node, attributes in root.nodes.items():
+        if 'span' in attributes:
+            graph.add_node(node, **_unquote(attributes))
+
+    for (source, target), attributes in root.edges.items():
+        graph.add_edge(source, target, **_unquote(attributes))
+
+    for subgraph in root.subgraphs.values():
+        if 'label' in subgraph.attributes:
+            cluster = subgraph.attributes['label'][1:-1]
+        elif subgraph.graph_stmt is not None and 'label' in subgraph.graph_stmt:
+            cluster = subgraph.graph_stmt['label'][1:-1]
+        else:
+            cluster = None
+        for node, attributes in subgraph.nodes.items():
+            if 'span' in attributes:
+                attr = _unquote(attributes)
+                if cluster is not None:
+                    attr['cluster'] = cluster
+                graph.add_node(node, **attr)
+
+    return graph
@@ -1,43 +1,162 @@
+import numpy as np
 from rapidfuzz import fuzz
 
+try:
+    from rapidfuzz.process import cdist
+except ImportError:  # rapidfuzz < 1.0, pairs are then scored one by one
+    cdist = None
+
+# Whether fuzz.ratio scores two empty strings as identical, which differs between rapidfuzz versions
+_EMPTY_EQUAL = fuzz.ratio('', '', score_cutoff=100) > 0
+_MISSING = object()
+
+
+class NeighbourIndex(object):
+    """
+    The unmarked neighbours of the nodes of a graph and their labels, computed on first use. Only valid while the graph
+    is not modified.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.neighbours = dict()
+        self.label_sets = dict()
+
+    def unmarked_neighbours(self, node):
+        try:
+            return self.neighbours[node]
+        except KeyError:
+            pass
+        graph = self.graph
+        result = [n for n in list(graph.successors(node)) + list(graph.predecessors(node)) if
+                  'color' not in graph.nodes[n].keys() or graph.nodes[n]['color'] == 'orange']
+        self.neighbours[node] = result
+        return result
+
+    def label(self, node):
+        """
+        The label of node in this graph, _MISSING when the graph has no such node or it has no label.
+        """
+        try:
+            return self.graph.nodes[node]['label']
+        except KeyError:
+            return _MISSING
+
+    def neighbour_labels(self, node):
+        try:
+            return self.label_sets[node]
+        except KeyError:
+            pass
+        labels = {self.label(n) for n in self.unmarked_neighbours(node)}
+        labels.discard(_MISSING)
+        self.label_sets[node] = labels
+        return labels
+
+
+class LabelMatrix(object):
+    """
+    Fuzzy equivalence between every string of labels_a and every string of labels_b, scored in batches with
+    rapidfuzz' cdist on all cores. Pairs outside the two lists are scored on demand and remembered.
+    """
+    ROWS_PER_BATCH = 1024
+
+    def __init__(self, labels_a, labels_b, fuzziness):
+        self.fuzziness = fuzziness
+        self.index_a = {l: i for i, l in enumerate(dict.fromkeys(labels_a))}
+        self.index_b = {l: i for i, l in enumerate(dict.fromkeys(labels_b))}
+        self.matrix = np.zeros((len(self.index_a), len(self.index_b)), dtype=bool)
+        self.other_pairs = dict()
+        if cdist is None:
+            self.index_a = dict()
+            self.index_b = dict()
+        elif len(self.index_a) > 0 and len(self.index_b) > 0:
+            strings_a = list(self.index_a.keys())
+            strings_b = list(self.index_b.keys())
+            for start in range(0, len(strings_a), self.ROWS_PER_BATCH):
+                scores = cdist(strings_a[start:start + self.ROWS_PER_BATCH], strings_b, scorer=fuzz.ratio,
+                               score_cutoff=fuzziness, workers=-1)
+                self.matrix[start:start + self.ROWS_PER_BATCH] = scores > 0
+
+    def eq(self, label_a: str, label_b: str) -> bool:
+        i = self.index_a.get(label_a)
+        j = self.index_b.get(label_b)
+        if i is not None and j is not None:
+            return bool(self.matrix[i, j])
+        try:
+            return self.other_pairs[(label_a, label_b)]
+        except KeyError:
+            result = fuzz.ratio(label_a, label_b, score_cutoff=self.fuzziness) > 0
+            self.other_pairs[(label_a, label_b)] = result
+            return result
+
+    def candidates(self, label_a: str) -> np.ndarray:
+        """
+        Indices, into labels_b without duplicates, of the labels equivalent to label_a.
+        """
+        return np.flatnonzero(self.matrix[self.index_a[label_a]])
+
 
 class Eq_Utils(object):
     def __init__(self, m_fuzziness, n_fuzziness):
         self.m_fuzziness = m_fuzziness
         self.n_fuzziness = n_fuzziness
+        # A score of 100 needs identical strings, so plain equality gives the same answer as fuzz.ratio
+        self.exact_context = m_fuzziness == 100
+        self.exact_label = n_fuzziness == 100
 
     def context_eq(self, context_a: str, context_b: str) -> bool:
+        if self.exact_context:
+            return context_a == context_b and (_EMPTY_EQUAL or context_a != '')
         return fuzz.ratio(context_a, context_b, score_cutoff=self.m_fuzziness) > 0
 
     def node_label_eq(self, node_label_a: str, node_label_b: str) -> bool:
+        if self.exact_label:
+            return node_label_a == node_label_b and (_EMPTY_EQUAL or node_label_a != '')
         return fuzz.ratio(node_label_a, node_label_b, score_cutoff=self.n_fuzziness) > 0
 
-    def node_eq(self, graph_a, node_a, graph_b, node_b):
-        if not (self.node_label_eq(graph_a.nodes[node_a]['label'], graph_b.nodes[node_b]['label'])):
-            return False
+    def label_matrix(self, labels_a, labels_b) -> LabelMatrix:
+        return LabelMatrix(labels_a, labels_b, self.n_fuzziness)
 
-        n_a = [n for n in list(graph_a.successors(node_a)) + list(graph_a.predecessors(node_a)) if
-               'color' not in graph_a.nodes[n].keys() or graph_a.nodes[n]['color'] == 'orange']
+    def context_matrix(self, contexts_a, contexts_b) -> LabelMatrix:
+        return LabelMatrix(contexts_a, contexts_b, self.m_fuzziness)
 
-        n_b = [n for n in list(graph_b.successors(node_b)) + list(graph_b.predecessors(node_b)) if
-               'color' not in graph_b.nodes[n].keys() or graph_b.nodes[n]['color'] == 'orange']
+    def node_eq(self, graph_a, node_a, graph_b, node_b, index_a: NeighbourIndex = None,
+                index_b: NeighbourIndex = None, label_eq=None):
+        """
+        :param label_eq: Replaces node_label_eq, e.g. by the eq of a LabelMatrix over the labels of both graphs
+        """
+        label_eq = self.node_label_eq if label_eq is None else label_eq
+        if not (label_eq(graph_a.nodes[node_a]['label'], graph_b.nodes[node_b]['label'])):
+            return False
+
+        index_a = NeighbourIndex(graph_a) if index_a is None else index_a
+        index_b = NeighbourIndex(graph_b) if index_b is None else index_b
+        n_a = index_a.unmarked_neighbours(node_a)
+        n_b = index_b.unmarked_neighbours(node_b)
 
         # We check for set inclusion, make sure we have the smaller set in the outer loop!
-        if len(n_a) > len(n_b):
+        swapped = len(n_a) > len(n_b)
+        if swapped:
             temp = n_b
             n_b = n_a
             n_a = temp
 
+        # Labels are still looked up in graph_a for the outer and graph_b for the inner nodes after the swap, nodes
+        # without one never match
+        if swapped:
+            inner = {index_b.label(n) for n in n_b}
+            inner.discard(_MISSING)
+        else:
+            inner = index_b.neighbour_labels(node_b)
+
         for node in n_a:
-            found = False
-            for other_node in n_b:
-                try:
-                    if self.node_label_eq(graph_a.nodes[node]['label'], graph_b.nodes[other_node]['label']):
-                        found = True
-                        break
-                except KeyError:
-                    pass
-            if not found:
+            label = index_a.label(node)
+            if label is _MISSING:
+                return False
+            if self.exact_label:
+                if label not in inner or not (_EMPTY_EQUAL or label != ''):
+                    return False
+            elif not any(label_eq(label, other_label) for other_label in inner):
                 return False
 
         return True
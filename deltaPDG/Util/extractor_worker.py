@@ -0,0 +1,250 @@
+"""
+Runs the PDG extractors, either once per file or as a long-lived worker process that is sent one file at a time.
+
+Both share the same interface, extract(args) -> bool, with args the arguments one would give the extractor on the
+command line.
+"""
+import logging
+import os
+import queue
+import subprocess
+import threading
+import time
+from typing import List, Optional
+
+SERVER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'PDGExtractor', 'server',
+                             'ExtractorServer.java')
+
+
+def _log_stream(stream, prefix: str):
+    for line in stream:
+        line = line.rstrip('\n')
+        if line:
+            logging.error('%s%s' % (prefix, line))
+    stream.close()
+
+
+class OneShotExtractor(object):
+    """
+    Starts the extractor anew for every file.
+    """
+
+    def __init__(self, command: List[str], cwd: Optional[str] = None):
+        self.command = command
+        self.cwd = cwd
+
+    def extract(self, args: List[str], cwd: Optional[str] = None) -> bool:
+        process = subprocess.Popen(self.command + args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                   cwd=cwd if cwd is not None else self.cwd)
+        stdout, stderr = process.communicate()
+        if stderr:
+            logging.error(stderr)
+        return process.returncode == 0
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_details):
+        self.close()
+
+
+class ExtractorWorker(object):
+    """
+    Keeps one extractor process alive and sends it requests over stdin, one per line with tab separated arguments. The
+    process answers every line on stdout with 'ok', 'error <message>', or 'pong' to a 'ping', and announces it is up
+    with 'ready'. Anything else the extractor prints should go to stderr, which is logged.
+
+    A worker that dies or does not answer within timeout seconds is killed and started again on the next request. One
+    that sat idle for idle_timeout seconds is pinged before it gets the next request, and started again when it does
+    not answer within ping_timeout, so a wedged JVM costs seconds rather than a full timeout. When it keeps dying on
+    consecutive requests, e.g. because the extractor calls System.exit, the worker gives up and runs the remaining
+    requests through fallback instead. Requests from several threads are served one after the other.
+    """
+
+    def __init__(self, command: List[str], fallback: OneShotExtractor = None, cwd: Optional[str] = None,
+                 timeout: float = 600, startup_timeout: float = 120, max_consecutive_failures: int = 3,
+                 idle_timeout: float = 60, ping_timeout: float = 10):
+        self.command = command
+        self.fallback = fallback
+        self.cwd = cwd
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self.idle_timeout = idle_timeout
+        self.ping_timeout = ping_timeout
+        self.last_used = None
+        self.max_consecutive_failures = max_consecutive_failures
+        self.process = None
+        self.lines = None
+        self.requests = 0
+        self.restarts = 0
+        self.consecutive_failures = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE, text=True, bufsize=1, cwd=self.cwd)
+        # Read both streams on their own threads, so a chatty extractor never blocks on a full pipe
+        self.lines = queue.Queue()
+        threading.Thread(target=self._read_stdout, args=(self.process.stdout, self.lines), daemon=True).start()
+        threading.Thread(target=_log_stream, args=(self.process.stderr, '[Extractor worker] '), daemon=True).start()
+        if self._answer(self.startup_timeout) != 'ready':
+            self.stop()
+            raise RuntimeError('Extractor worker %s did not start' % ' '.join(self.command))
+
+    @staticmethod
+    def _read_stdout(stream, lines: queue.Queue):
+        for line in stream:
+            lines.put(line.rstrip('\n'))
+        lines.put(None)
+
+    def _answer(self, timeout: float) -> Optional[str]:
+        """
+        :return: The next line the worker wrote, None when it exited or timed out
+        """
+        try:
+            return self.lines.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _send(self, line: str, timeout: float) -> Optional[str]:
+        try:
+            self.process.stdin.write(line + '\n')
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            return None
+        return self._answer(timeout)
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def ping(self, timeout: float = None) -> bool:
+        with self._lock:
+            return self._ping(timeout)
+
+    def _ping(self, timeout: float = None) -> bool:
+        return self.alive() and self._send('ping', timeout if timeout is not None else self.ping_timeout) == 'pong'
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    def restart(self):
+        self.stop()
+        self.restarts += 1
+        self.start()
+
+    def extract(self, args: List[str], cwd: Optional[str] = None) -> bool:
+        """
+        :param cwd: Only honoured by the fallback, the worker resolves paths against its own directory
+        """
+        with self._lock:
+            return self._extract(args, cwd)
+
+    def _extract(self, args: List[str], cwd: Optional[str]) -> bool:
+        if self.consecutive_failures >= self.max_consecutive_failures and self.fallback is not None:
+            return self.fallback.extract(args, cwd)
+
+        if self.alive() and self.last_used is not None and time.monotonic() - self.last_used > self.idle_timeout \
+                and not self._ping():
+            logging.warning('[Extractor worker] No answer to a ping after being idle, restarting it')
+            self.stop()
+        if not self.alive():
+            try:
+                if self.requests > 0:
+                    self.restart()
+                else:
+                    self.start()
+            except (OSError, RuntimeError) as e:
+                logging.error('[Extractor worker] %s' % e)
+                self._failed()
+                return self.fallback.extract(args, cwd) if self.fallback is not None else False
+        self.requests += 1
+
+        answer = self._send('\t'.join(args), self.timeout)
+        self.last_used = time.monotonic()
+        if answer is None:
+            # Crashed, exited or hung, the next request gets a fresh process
+            try:
+                returncode = self.process.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                returncode = None
+            self.stop()
+            self._failed()
+            return returncode == 0
+        self.consecutive_failures = 0
+        if answer != 'ok':
+            logging.error('[Extractor worker] %s' % answer)
+            return False
+        return True
+
+    def _failed(self):
+        self.consecutive_failures += 1
+        if self.consecutive_failures == self.max_consecutive_failures and self.fallback is not None:
+            logging.warning('Extractor worker failed %d times in a row, starting one process per file from now on'
+                            % self.consecutive_failures)
+
+    def close(self):
+        self.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_details):
+        self.close()
+
+
+class ExtractorPool(object):
+    """
+    Several ExtractorWorkers, each request goes to one that is idle.
+    """
+
+    def __init__(self, workers: List[ExtractorWorker]):
+        self.workers = workers
+        self.idle = queue.Queue()
+        for worker in workers:
+            self.idle.put(worker)
+
+    def extract(self, args: List[str], cwd: Optional[str] = None) -> bool:
+        worker = self.idle.get()
+        try:
+            return worker.extract(args, cwd)
+        finally:
+            self.idle.put(worker)
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_details):
+        self.close()
+
+
+def start_extractor(extractor_location: str, src_code: str, persistent: bool = True, processes: int = 1):
+    """
+    The extractor for a language. Java runs in processes ExtractorWorkers around PDGExtractor/server/ExtractorServer.java
+    when persistent, C# has no persistent mode and always starts PDGExtractor once per file.
+    """
+    if src_code == 'java':
+        one_shot = OneShotExtractor(['java', '-jar', extractor_location])
+        if not persistent:
+            return one_shot
+        # Single-file source launch, the server is compiled in memory when the worker starts
+        workers = [ExtractorWorker(['java', '-cp', extractor_location, os.path.normpath(SERVER_SOURCE),
+                                    extractor_location], fallback=one_shot) for _ in range(processes)]
+        return workers[0] if processes == 1 else ExtractorPool(workers)
+    if extractor_location.endswith('.dll'):
+        return OneShotExtractor(['dotnet', extractor_location])
+    return OneShotExtractor([extractor_location])
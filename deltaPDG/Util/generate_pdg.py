@@ -1,12 +1,18 @@
 import json
 import os
 import shutil
-import subprocess
 import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
 import networkx as nx
 
+from deltaPDG.Util.extractor_worker import start_extractor
+from deltaPDG.Util.git_util import RevisionFiles
+from deltaPDG.Util.graph_cache import PdgCache
 from deltaPDG.Util.merge_nameflow import add_nameflow_edges
-from deltaPDG.Util.pygraph_util import read_graph_from_dot, obj_dict_to_networkx
+from deltaPDG.Util.pygraph_util import read_nxgraph_from_dot
 
 logging.basicConfig(level=logging.INFO,
                     format='[%(asctime)s][%(name)s] %(levelname)s: %(message)s',
@@ -16,32 +22,151 @@ logging.basicConfig(level=logging.INFO,
 
 class PdgGenerator:
     """
-    This class serves as a wrapper to abstract away calling the Java or c# compiled PDG extractor
+    This class serves as a wrapper to abstract away calling the Java or c# compiled PDG extractor.
+    Given a PdgCache, the extractor only runs for file contents it has not seen before. Given an extractor from
+    start_extractor, e.g. a persistent worker shared by several generators, that one is used instead of starting the
+    extractor once per file. Given RevisionFiles, the repository is its scratch directory and only the files asked for
+    are written to it, at the revision it is set to.
     """
 
     def __init__(self, repository_location, target_filename="pdg.dot",
-                 target_location=os.getcwd(), extractor_location="./PDGExtractor/TinyPDG-1.0.0.jar"):
-        self.repository_location = repository_location
+                 target_location=os.getcwd(), extractor_location="./PDGExtractor/TinyPDG-1.0.0.jar",
+                 cache: PdgCache = None, extractor=None, files: RevisionFiles = None):
+        self.repository_location = repository_location if files is None else files.directory
         self.target_filename = target_filename
         self.target_location = target_location
         self.extractor_location = extractor_location
+        self.cache = cache
+        self.extractor = extractor
+        self.files = files
+
+    def _source(self, filename) -> str:
+        if self.files is not None:
+            self.files.materialise(filename)
+        return self.repository_location + filename
+
+    def _key(self, source, filename, src_code) -> str:
+        # The cached PDGs hold the nameflow edges, so the nameflows.json they came from is part of the key
+        return self.cache.key(source, filename, self.extractor_location, src_code,
+                              os.path.join(self.repository_location, 'nameflows.json'))
+
+    def _extractor(self, src_code):
+        if self.extractor is not None:
+            return self.extractor
+        return start_extractor(self.extractor_location, src_code, persistent=False)
 
     def __call__(self, filename, src_code):
+        source = self._source(filename)
+        if self.cache is None or src_code not in ('java', 'csharp') or not os.path.exists(source):
+            self.extract(filename, src_code)
+            return
+
+        key = self._key(source, filename, src_code)
+        target = os.path.join(self.target_location, self.target_filename)
+        cached = self.cache.get(key)
+        if cached is not None:
+            try:
+                shutil.copyfile(cached, target)
+                return
+            except FileNotFoundError:
+                # Evicted by another process in the meantime
+                pass
+        if self.extract(filename, src_code):
+            self.cache.put(key, lambda temp: shutil.copyfile(target, temp))
+
+    def extract(self, filename, src_code) -> bool:
+        """
+        Run the extractor on filename and add the nameflow edges.
+
+        :return: Whether a complete PDG was written, only those are worth caching
+        """
+        target = os.path.join(self.target_location, self.target_filename)
+        complete, apdg = self._extract(filename, src_code, target)
+        if apdg is not None:
+            try:
+                nx.drawing.nx_pydot.write_dot(apdg, target)
+            except Exception as e:
+                logging.error(f"Error adding nameflow edges: {e}")
+                return False
+        return complete
+
+    def batch(self, filenames: Iterable[str], src_code: str, workers: int = 1) -> Dict[str, Optional[nx.MultiDiGraph]]:
+        """
+        Extract the PDGs of several files of this revision, returned as graphs with the nameflow edges added rather than
+        written to target_filename, the same graphs read_nxgraph_from_dot gives for the files __call__ writes. Files
+        that do not exist at this revision map to None.
+
+        Java files are extracted by up to workers threads, which is only worth it when the extractor can serve several
+        at once (one process per file, or an ExtractorPool). C# files are extracted one at a time, as the C# extractor
+        writes its nameflow and PDG files into the repository.
+        """
+        filenames = list(dict.fromkeys(filenames))
+        batch_location = tempfile.mkdtemp(prefix='batch_', dir=self.target_location)
+        try:
+            def one(position: int) -> Optional[nx.MultiDiGraph]:
+                return self._batch_one(filenames[position], src_code,
+                                       os.path.join(batch_location, '%d_%s' % (position, self.target_filename)))
+
+            if src_code == 'java' and workers > 1 and len(filenames) > 1:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    graphs = list(pool.map(one, range(len(filenames))))
+            else:
+                graphs = [one(position) for position in range(len(filenames))]
+        finally:
+            shutil.rmtree(batch_location, ignore_errors=True)
+        return dict(zip(filenames, graphs))
+
+    def _batch_one(self, filename: str, src_code: str, target: str) -> Optional[nx.MultiDiGraph]:
+        source = self._source(filename)
+        if not os.path.exists(source):
+            return None
+        key = None
+        if self.cache is not None and src_code in ('java', 'csharp'):
+            key = self._key(source, filename, src_code)
+            cached = self.cache.get(key)
+            if cached is not None:
+                try:
+                    return read_nxgraph_from_dot(cached)
+                except FileNotFoundError:
+                    # Evicted by another process in the meantime
+                    pass
+
+        # Written out and read back as extract and the cache do, so every path gives the same graph; the DOT round
+        # trip keeps one edge per pair of nodes and makes the keys strings
+        complete, apdg = self._extract(filename, src_code, target)
+        if apdg is not None:
+            try:
+                nx.drawing.nx_pydot.write_dot(apdg, target)
+            except Exception as e:
+                logging.error(f"Error adding nameflow edges: {e}")
+                complete = False
+        if not os.path.exists(target):
+            return None
+        if complete and key is not None:
+            self.cache.put(key, lambda temp: shutil.copyfile(target, temp))
+        return read_nxgraph_from_dot(target)
+
+    def _extract(self, filename, src_code, target) -> Tuple[bool, Optional[nx.MultiDiGraph]]:
+        """
+        Extract the PDG of filename into target.
+
+        :return: Whether the PDG is complete, and the PDG with the nameflow edges added when there were any; target
+                 then still holds the PDG without them
+        """
+        self._source(filename)
+        complete = True
+        apdg = None
         if src_code == 'java':
             # if the file does not exist, return
             if not os.path.exists(self.repository_location + filename):
-                return
+                return False, None
             logging.info(f"Extracting PDG for {os.path.join(self.repository_location, filename)}")
             # jar_path = "./PDGExtractor/PropertyGraph.jar"
             # jar_path = "./PDGExtractor/TinyPDG-0.1.0.jar"
             # command = ["java", "-jar", self.extractor_location, "-d", self.repository_location + filename,
             #            "-p", os.path.join(self.target_location, self.target_filename)]
-            command = ["java", "-jar", self.extractor_location,
-                       self.repository_location + filename, os.path.join(self.target_location, self.target_filename)]
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            stdout, stderr = process.communicate()
-            if stderr:
-                logging.error(stderr)
+            extracted = self._extractor(src_code).extract([self.repository_location + filename, target])
+            complete = extracted and os.path.exists(target)
 
         # t_filename = os.path.basename(filename).split('.')[0]
         # bin_path = t_filename + '.bin'
@@ -57,32 +182,27 @@ class PdgGenerator:
         # process2.wait()
         elif src_code == 'csharp':
             if not os.path.exists(self.repository_location + filename):
-                return
+                return False, None
             logging.info(f"Extracting PDG for {os.path.join(self.repository_location, filename)}")
-            generate_a_pdg = subprocess.Popen([self.extractor_location, '.', '.' + filename],
-                                              bufsize=1, cwd=self.repository_location)
-            stdout, stderr = generate_a_pdg.communicate()
-            if stderr:
-                logging.error(stderr)
+            self._extractor(src_code).extract(['.', '.' + filename], cwd=self.repository_location)
 
             try:
                 dir_name = os.path.dirname(self.repository_location + filename)
                 base_name = os.path.basename(filename).split('.')[0]
-                logging.info("Moving %s to %s" % (dir_name + '/PDG/' + base_name + '_pdg.dot',
-                                                  os.path.join(self.target_location, self.target_filename)))
-                shutil.move(dir_name + '/PDG/' + base_name + '_pdg.dot',
-                            os.path.join(self.target_location, self.target_filename))
+                logging.info("Moving %s to %s" % (dir_name + '/PDG/' + base_name + '_pdg.dot', target))
+                shutil.move(dir_name + '/PDG/' + base_name + '_pdg.dot', target)
                 # shutil.move(os.path.join(self.repository_location, 'pdg.dot'),
                 #             os.path.join(self.target_location, self.target_filename))
             except FileNotFoundError:
-                with open(os.path.join(self.target_location, self.target_filename), 'w') as f:
+                complete = False
+                with open(target, 'w') as f:
                     f.write('digraph "extractedGraph"{\n}\n')
 
         try:
             if src_code == 'csharp':
                 shutil.move(os.path.join(self.repository_location, 'nameflows.json'),
-                            os.path.join(self.target_location,
-                                         'nameflows_' + self.target_filename.split('.')[0] + '.json'))
+                            os.path.join(os.path.dirname(target),
+                                         'nameflows_' + os.path.basename(target).split('.')[0] + '.json'))
             with open(os.path.join(self.repository_location, 'nameflows.json'), encoding='utf-8-sig') as json_data:
                 nameflow_data = json.loads(json_data.read())
 
@@ -100,12 +220,14 @@ class PdgGenerator:
             nameflow_data['relations'] = [[] if v is None else v for v in nameflow_data['relations']]
 
             # And add nameflow edges
-            apdg = obj_dict_to_networkx(read_graph_from_dot(os.path.join(self.target_location, self.target_filename)))
-            apdg = add_nameflow_edges(nameflow_data, apdg)
-            nx.drawing.nx_pydot.write_dot(apdg, os.path.join(self.target_location, self.target_filename))
+            apdg = add_nameflow_edges(nameflow_data, read_nxgraph_from_dot(target), copy=False)
 
         except FileNotFoundError:
             # No file, nothing to add
             pass
         except Exception as e:
+            complete = False
+            apdg = None
             logging.error(f"Error adding nameflow edges: {e}")
+
+        return complete, apdg
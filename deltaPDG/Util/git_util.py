@@ -1,42 +1,277 @@
 import datetime
 import email.utils as eut
+import os
 import re
 import shutil
 import subprocess
 import tempfile
-from typing import Tuple, List, Any, Optional
+import threading
+from typing import Tuple, List, Optional, Iterable, Iterator
 
-commit_line = re.compile(r'commit [0-9a-f]{40}\n')
-captured_commit_line = re.compile(r'(commit [0-9a-f]{40}\n)')
+
+class BlobReader(object):
+    """
+    Reads file contents at any revision of a repository through one long-lived git cat-file --batch process.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.process = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        self.process = subprocess.Popen(['git', 'cat-file', '--batch'], cwd=self.path, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE)
+
+    def read(self, rev: str, path: str) -> Optional[bytes]:
+        """
+        :param path: Relative to the repository root, a leading / as in the diffs is ignored
+        :return: The content of the file at rev, None when there is no such file
+        """
+        with self._lock:
+            if self.process is None or self.process.poll() is not None:
+                self._start()
+            self.process.stdin.write(('%s:%s\n' % (rev, path.lstrip('/'))).encode('utf-8'))
+            self.process.stdin.flush()
+            header = self.process.stdout.readline().split()
+            if len(header) != 3:
+                # <object> missing, or ambiguous
+                return None
+            size = int(header[2])
+            content = self.process.stdout.read(size)
+            self.process.stdout.read(1)
+            return content if header[1] == b'blob' else None
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_details):
+        self.close()
+
+
+class RevisionFiles(object):
+    """
+    A scratch directory holding some of the files of a revision, written from a BlobReader on demand rather than
+    checked out. Paths inside it are the same as in the repository.
+
+    The untracked files, e.g. /nameflows.json, are written at every revision: from git where the revision has them,
+    otherwise copied from the working tree of the repository, as they would stay in place in a checkout.
+    """
+
+    def __init__(self, reader: BlobReader, directory: str, untracked: Iterable[str] = ()):
+        self.reader = reader
+        self.directory = directory
+        self.untracked = list(untracked)
+        self.revision = None
+        self.materialised = set()
+
+    def set_revision(self, rev: str):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory)
+        self.revision = rev
+        self.materialised = set()
+        for filename in self.untracked:
+            source = os.path.join(self.reader.path, filename.lstrip('/'))
+            if not self.materialise(filename) and os.path.isfile(source):
+                os.makedirs(os.path.dirname(self.directory + filename), exist_ok=True)
+                shutil.copyfile(source, self.directory + filename)
+
+    def materialise(self, filename: str) -> bool:
+        """
+        Write filename as it is at the current revision.
+
+        :return: Whether the file exists at that revision
+        """
+        location = self.directory + filename
+        if filename not in self.materialised:
+            self.materialised.add(filename)
+            content = self.reader.read(self.revision, filename)
+            if content is not None:
+                os.makedirs(os.path.dirname(location), exist_ok=True)
+                with open(location, 'wb') as f:
+                    f.write(content)
+        return os.path.exists(location)
+
+
+class FileDiffParser(object):
+    """
+    Turns the lines of one file's diff, fed one at a time, into (type, file, after line, before line, line) changes the
+    way GitUtil.process_diff_output does for the whole text, without holding on to the text.
+
+    The file is named by the --- line, or by the +++ line when 'new file mode' appears anywhere in the diff. Where the
+    two differ (renames and deletions) the changes are held back until either that is seen or the diff ends.
+    """
+
+    def __init__(self):
+        self.head = list()
+        self.paths = None
+        self.filepath = None
+        self.new_file = False
+        self.held = list()
+        self.add_ctr = 0
+        self.del_ctr = 0
+
+    def feed(self, line: str) -> List[Tuple[str, str, int, int, str]]:
+        if 'new file mode' in line:
+            self.new_file = True
+            if self.paths is not None and self.filepath is None:
+                self.filepath = self.paths[1]
+                held = self.held
+                self.held = list()
+                return [(t, self.filepath, after, before, content) for t, _, after, before, content in held] \
+                    + self.feed(line)
+        if self.paths is None:
+            return self._feed_head(line)
+
+        line = line.strip()
+        if line.startswith('-'):
+            change = ('-', self.filepath, -1, self.del_ctr, line[1:])
+            self.del_ctr += 1
+        elif line.startswith('+'):
+            change = ('+', self.filepath, self.add_ctr, -1, line[1:])
+            self.add_ctr += 1
+        elif line.startswith('@@'):
+            self.del_ctr = int(line.split(' ')[1].split(',')[0][1:])
+            self.add_ctr = int(line.split(' ')[2].split(',')[0][1:])
+            return []
+        elif line.startswith('\\ No newline at end of file'):
+            return []
+        else:
+            self.del_ctr += 1
+            self.add_ctr += 1
+            return []
+        if self.filepath is None:
+            self.held.append(change)
+            return []
+        return [change]
+
+    def _feed_head(self, line: str) -> List[Tuple[str, str, int, int, str]]:
+        if self.head is None:
+            return list()
+        self.head.append(line)
+        if not line.startswith('@@'):
+            return list()
+        header = len(self.head) - 1
+        if header < 2:
+            # No --- and +++ lines in front of the hunk, process_diff_output finds no changes either
+            self.head = None
+            return list()
+        self.paths = tuple(re.sub(r'^("?)[ab]/', r'\1/', l[4:]) for l in self.head[header - 2:header])
+        self.head = None
+        if self.new_file or self.paths[0] == self.paths[1]:
+            self.filepath = self.paths[1 if self.new_file else 0]
+        return self.feed(line)
+
+    def close(self) -> List[Tuple[str, str, int, int, str]]:
+        held = [(t, self.paths[0], after, before, content) for t, _, after, before, content in self.held]
+        self.held = list()
+        return held
 
 
 class GitUtil(object):
-    def __init__(self, temp_dir):
+    """
+    With worktree, the temporary repositories are worktrees of the original (git worktree add --detach), sharing its
+    objects, rather than complete copies. The untracked files of the original that are not ignored are copied into
+    them, and so are the INPUTS even when ignored, but not ignored build outputs or caches. They are removed from it
+    again on exit.
+    """
+
+    # Files outside of git the PDG extraction reads from the repository
+    INPUTS = ('/nameflows.json',)
+
+    def __init__(self, temp_dir, worktree: bool = False):
         self.temp_dir = temp_dir
+        self.worktree = worktree
 
     def _clean_up(self):
+        for reader in self.readers:
+            reader.close()
         for path in self.temp_paths:
+            if path in self.worktrees:
+                subprocess.run(['git', 'worktree', 'remove', '--force', os.path.abspath(path)],
+                               cwd=self.worktrees[path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             shutil.rmtree(path, ignore_errors=True)
+        # Also forgets worktrees whose removal failed, or that a killed run left behind
+        for repository in set(self.worktrees.values()):
+            subprocess.run(['git', 'worktree', 'prune'], cwd=repository,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
     def __enter__(self):
         self.temp_paths = []
+        self.worktrees = dict()
+        self.readers = []
         return self
 
     def __exit__(self, *exc_details):
         self._clean_up()
 
-    def move_git_repo_to_tmp(self, url: str) -> str:
+    def move_git_repo_to_tmp(self, url: str, checkout: bool = True) -> str:
+        """
+        :param checkout: In worktree mode, whether to check out HEAD. Not needed when only reading the history or when
+                         moving to another revision straight away
+        """
         path = tempfile.mkdtemp(suffix=".gitYarn", dir=self.temp_dir)
         shutil.rmtree(path)
-        shutil.copytree(url, path, symlinks=True, )
+        if self.worktree:
+            command = ['git', 'worktree', 'add', '--quiet', '--detach'] + ([] if checkout else ['--no-checkout']) + \
+                      [os.path.abspath(path)]
+            subprocess.run(command, cwd=url, check=True, stdout=subprocess.DEVNULL)
+            self.worktrees[path] = url
+            self._copy_untracked(url, path)
+        else:
+            shutil.copytree(url, path, symlinks=True, )
 
         self.temp_paths.append(path)
         return path
 
+    @staticmethod
+    def _copy_untracked(url: str, path: str):
+        output = subprocess.run(['git', 'ls-files', '--others', '--exclude-standard', '-z'], cwd=url,
+                                stdout=subprocess.PIPE, check=True).stdout
+        names = set(output.decode('utf-8', 'surrogateescape').split('\0'))
+        names.update(name.lstrip('/') for name in GitUtil.INPUTS if os.path.isfile(os.path.join(url, name.lstrip('/'))))
+        for name in sorted(names):
+            if not name:
+                continue
+            # Nested repositories are listed as a directory, name/
+            source = os.path.join(url, name.rstrip('/'))
+            destination = os.path.join(path, name.rstrip('/'))
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            if os.path.isdir(source) and not os.path.islink(source):
+                shutil.copytree(source, destination, symlinks=True)
+            else:
+                shutil.copy2(source, destination, follow_symlinks=False)
+
+    def blob_reader(self, url: str) -> BlobReader:
+        """
+        A BlobReader on the repository at url, closed on exit.
+        """
+        reader = BlobReader(url)
+        self.readers.append(reader)
+        return reader
+
+    def revision_files(self, url: str, untracked: Iterable[str] = INPUTS) -> RevisionFiles:
+        """
+        An empty RevisionFiles of the repository at url in the temporary directory, call set_revision before use.
+
+        :param untracked: Files written at every revision even when git does not have them, see RevisionFiles. By
+                          default the INPUTS, e.g. the nameflows.json PdgGenerator reads from the repository
+        """
+        path = tempfile.mkdtemp(suffix=".gitFiles", dir=self.temp_dir)
+        self.temp_paths.append(path)
+        return RevisionFiles(self.blob_reader(url), path, untracked)
+
     @staticmethod
     def set_git_to_rev(sha: str, path: str):
-        subprocess.run(['git', 'config', 'advice.detachedHead', 'false'], cwd=path)
-        git_reset_process = subprocess.Popen(['git', 'checkout', '-f', sha], cwd=path)
+        # Set for this command only, a worktree shares its configuration with the original repository
+        git_reset_process = subprocess.Popen(['git', '-c', 'advice.detachedHead=false', 'checkout', '-f', sha],
+                                             cwd=path)
         git_reset_process.wait()
 
     @staticmethod
@@ -84,32 +319,47 @@ class GitUtil(object):
         return show_lines[0]
 
     @staticmethod
-    def process_diff_between_commits(sha_old: str, sha_new: str, path: str) -> List[Tuple[str, str, int, int, str]]:
-        diff_show_process = subprocess.Popen(['git', 'diff', '%s..%s' % (sha_old, sha_new)],
-                                             stdout=subprocess.PIPE, cwd=path).stdout
-        show_lines = list(map(lambda line: line.decode('utf-8', 'replace'), diff_show_process.readlines()))
-        diff_show_process.close()
+    def _read_lines(stream) -> Iterator[str]:
+        for line in stream:
+            line = line.decode('utf-8', 'replace')
+            yield line[:-1] if line.endswith('\n') else line
 
-        current_index = 0
-        diffs = []
-        if current_index < len(show_lines):
-            current_diff = ''
-            while True:
-                curr_line = show_lines[current_index]
-                if current_index + 1 == len(show_lines):  # We reached the EOF
-                    current_diff += curr_line
-                    diffs.append(current_diff.strip())
-                    break
-                elif (curr_line.startswith('diff --git')) or (
-                        curr_line.startswith('diff --cc')):  # New diff for this commit
-                    if current_diff != '':
-                        diffs.append(current_diff.strip())
-                    current_diff = curr_line
-                else:
-                    current_diff += curr_line
-                current_index += 1
+    @staticmethod
+    def iter_diff(lines: Iterable[str]) -> Iterator[Tuple[str, str, int, int, str]]:
+        """
+        Parse the output of git diff or git show, without line endings, as it comes in. A file's diff starts at a
+        diff --git or diff --cc line; the changes are the same as process_diff_output gives for each of them.
+        """
+        parser = FileDiffParser()
+        started = False
+        previous = None
+        for line in lines:
+            if previous is not None:
+                if previous.startswith('diff --git') or previous.startswith('diff --cc'):
+                    yield from parser.close()
+                    parser = FileDiffParser()
+                    started = False
+                if not started:
+                    # Leading blank lines and indentation are stripped off each file's diff
+                    previous = previous.lstrip()
+                    started = previous != ''
+                if started:
+                    yield from parser.feed(previous)
+            previous = line
+        # The very last line always belongs to the current file's diff
+        if previous is not None and (started or previous.strip() != ''):
+            yield from parser.feed(previous if started else previous.lstrip())
+        yield from parser.close()
+
+    @staticmethod
+    def iter_diff_between_commits(sha_old: str, sha_new: str, path: str) -> Iterator[Tuple[str, str, int, int, str]]:
+        with subprocess.Popen(['git', 'diff', '%s..%s' % (sha_old, sha_new)], stdout=subprocess.PIPE,
+                              cwd=path) as process:
+            yield from GitUtil.iter_diff(GitUtil._read_lines(process.stdout))
 
-        return [v for sublist in list(map(GitUtil.process_diff_output, diffs)) for v in sublist]
+    @staticmethod
+    def process_diff_between_commits(sha_old: str, sha_new: str, path: str) -> List[Tuple[str, str, int, int, str]]:
+        return list(GitUtil.iter_diff_between_commits(sha_old, sha_new, path))
 
     @staticmethod
     def get_commit_msg(sha: str, path: str) -> str:
@@ -129,48 +379,10 @@ class GitUtil(object):
         return list(map(lambda line: line.decode('utf-8', 'replace').split(' ')[0].strip(), commit_hashes))
 
     @staticmethod
-    def parse_git_log_entry(entry: str) -> Optional[Tuple[str, str, datetime.datetime, str, Any]]:
-        """
-        The expected format is:
-        commit <sha>[ (Pointer indication for a particular repository)]
-        Author: <Name> <email>
-        Date: <timestamp>
-        <Multi-line commit messge>
-        <Individual file diffs>^n
-        """
-        entry = entry.split('\n')
-        if any('Merge: ' in e for e in entry):
-            return None
-
-        sha = entry[0].split()[1].strip()
-        try:
-            author = entry[1].lstrip()[len('Author: '):entry[1].index('<')].strip()
-        except ValueError:
-            return None  # No author => we cannot verify our construction requirement
-        try:
-            date = eut.parsedate_to_datetime(entry[2].lstrip()[len('Date: '):])
-        except TypeError:
-            return None  # No date => we cannot verify our construction requirement
-
-        msg_and_diff = re.split(r'(diff --.*\n)', '\n'.join(entry[3:]))
-        msg = msg_and_diff[0]
-
-        diffs = msg_and_diff[1:]
-        diffs = [i1 + i2 for i1, i2 in zip(diffs[0::2], diffs[1::2])]
-        diffs = [v for sublist in list(map(GitUtil.process_diff_output, diffs)) for v in sublist]
-
-        return sha, author, date, msg, diffs
-
-    @staticmethod
-    def get_all_commit_hashes_authors_dates_messages(path: str) -> List[Tuple[str, str, datetime.datetime, str, Any]]:
-        commit_hashes_process = subprocess.Popen(['git', 'log', '--branches=*', '--reverse', '--unified=0'],
-                                                 stdout=subprocess.PIPE, cwd=path).stdout
-        commit_hashes = commit_hashes_process.read().decode('utf-8', 'replace')
-        commit_hashes_process.close()
-        list_of_commit_metadata = re.split(captured_commit_line, commit_hashes)[1:]
-        list_of_commit_metadata = [i1 + i2 for i1, i2 in
-                                   zip(list_of_commit_metadata[0::2], list_of_commit_metadata[1::2])]
-        return [e for e in [GitUtil.parse_git_log_entry(e) for e in list_of_commit_metadata] if e is not None]
+    def get_branch_tips(path: str) -> List[str]:
+        output = subprocess.run(['git', 'for-each-ref', '--format=%(objectname)', 'refs/heads'],
+                                cwd=path, stdout=subprocess.PIPE, check=True).stdout
+        return sorted(set(output.decode('utf-8').split()))
 
     @staticmethod
     def get_author(sha: str, path: str) -> str:
@@ -192,53 +404,29 @@ class GitUtil(object):
 
     @staticmethod
     def process_a_commit(sha: str, path: str) -> Tuple[str, List[Tuple[str, str, int, int, str]]]:
-        commit_show_process = subprocess.Popen(['git', 'show', '--format=fuller', '--unified=0', sha],
-                                               stdout=subprocess.PIPE, cwd=path).stdout
-        show_lines = list(map(lambda line: line.decode('utf-8', 'replace'), commit_show_process.readlines()))
-        commit_show_process.close()
-
-        # Sanity check that we are looking at the expected commit
-        assert (len(show_lines) > 0)
-        assert (show_lines[0].split(' ')[-1].strip().startswith(sha))
-
-        # Navigate to the start of the commit diff
-        current_index = 0
-        while not (show_lines[current_index].startswith('Author')):
-            current_index += 1
-        author = show_lines[current_index].split(':')[-1][1:].strip().split('<')[0][:-1]
-        current_index += 4
-        while not (show_lines[current_index] == '\n'):
-            current_index += 1
-        current_index += 1
-        if current_index < len(show_lines):
-            while True:
-                curr_line = show_lines[current_index]
-                current_index += 1
-                if curr_line == '\n':
-                    break
-                if current_index == len(show_lines):  # We reached EOF in title, i.e. the commit has no diff-s
-                    break
-        # End of navigation to start of diff
-
-        diffs = []
-        if current_index < len(show_lines):
-            current_diff = ''
-            while True:
-                curr_line = show_lines[current_index]
-                if current_index + 1 == len(show_lines):  # We reached the EOF
-                    current_diff += curr_line
-                    diffs.append(current_diff.strip())
+        with subprocess.Popen(['git', 'show', '--format=fuller', '--unified=0', sha], stdout=subprocess.PIPE,
+                              cwd=path) as process:
+            show_lines = GitUtil._read_lines(process.stdout)
+            line = next(show_lines, None)
+
+            # Sanity check that we are looking at the expected commit
+            assert (line is not None)
+            assert (line.split(' ')[-1].strip().startswith(sha))
+
+            # Navigate to the start of the commit diff
+            while not (line.startswith('Author')):
+                line = next(show_lines)
+            author = line.split(':')[-1][1:].strip().split('<')[0][:-1]
+            for _ in range(3):
+                next(show_lines)
+            while next(show_lines) != '':
+                pass
+            for line in show_lines:
+                if line == '':
                     break
-                elif (curr_line.startswith('diff --git')) or (
-                        curr_line.startswith('diff --cc')):  # New diff for this commit
-                    if current_diff != '':
-                        diffs.append(current_diff.strip())
-                    current_diff = curr_line
-                else:
-                    current_diff += curr_line
-                current_index += 1
+            # End of navigation to start of diff
 
-        diffs = [v for sublist in list(map(GitUtil.process_diff_output, diffs)) for v in sublist]
+            diffs = list(GitUtil.iter_diff(show_lines))
         return author, diffs
 
     @staticmethod
@@ -282,35 +470,6 @@ class GitUtil(object):
 
     @staticmethod
     def process_diff_output(diff: str) -> List[Tuple[str, str, int, int, str]]:
-        header = 0
-        lines = diff.split('\n')
-        while not (lines[header].startswith('@@')):
-            header += 1
-            if header == len(lines):
-                return list()
-        header -= 2
-        lines = lines[header:]
-        filepath = re.sub(r'^("?)[ab]/', r'\1/', lines[1 if 'new file mode' in diff else 0][4:])
-        diff = lines[2:]
-        segmented_diffs = list()
-        add_ctr = 0
-        del_ctr = 0
-        for line in diff:
-            line = line.strip()
-            if line.startswith('@@'):
-                del_ctr = int(line.split(' ')[1].split(',')[0][1:])
-                add_ctr = int(line.split(' ')[2].split(',')[0][1:])
-            elif line.startswith('-'):
-                segmented_diffs.append(('-', filepath, -1, del_ctr, line[1:]))
-                del_ctr += 1
-            elif line.startswith('+'):
-                segmented_diffs.append(('+', filepath, add_ctr, -1, line[1:]))
-                add_ctr += 1
-            elif line.startswith('\\ No newline at end of file'):
-                pass
-            else:
-                segmented_diffs.append((' ', filepath, add_ctr, del_ctr, line))
-                del_ctr += 1
-                add_ctr += 1
-
-        return [p for p in segmented_diffs if p[0] != ' ']
+        parser = FileDiffParser()
+        changes = [change for line in diff.split('\n') for change in parser.feed(line)]
+        return changes + parser.close()
@@ -0,0 +1,211 @@
+"""
+A persistent cache of parsed deltaPDGs, so repeated evaluation passes over a corpus skip parsing .dot files.
+"""
+import hashlib
+import os
+import threading
+from typing import Callable, Dict, Optional
+
+import networkx as nx
+
+from deltaPDG.Util.binary_graph import BINARY_SUFFIX, read_binary_graph, write_binary_graph
+from deltaPDG.Util.pygraph_util import read_nxgraph_from_dot
+
+DEFAULT_GRAPH_CACHE = os.path.join('.', 'tmp', 'graph_cache')
+DEFAULT_PDG_CACHE = os.path.join('.', 'tmp', 'pdg_cache')
+
+
+class LRUFileCache(object):
+    """
+    A directory of files addressed by key, the least recently used files are removed once the directory grows past
+    max_bytes. Recency is kept in the file modification times, so it survives between runs.
+
+    Several processes may share the directory. Each counts its own writes on top of the size it last measured, and the
+    directory is measured again once the count passes max_bytes or a process wrote a sixteenth of max_bytes since, so
+    together they overshoot the cap by little.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 2 * 1024 ** 3, suffix: str = ''):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = self._measure()
+        self._written = 0
+
+    def _measure(self) -> int:
+        size = 0
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file():
+                    size += entry.stat().st_size
+            except FileNotFoundError:
+                pass
+        return size
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        :return: The path of the cached file, or None when key is not cached
+        """
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, key: str, write: Callable[[str], None]) -> str:
+        """
+        Store the file produced by write(path) under key.
+        """
+        path = self.path(key)
+        temp = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        write(temp)
+        size = os.path.getsize(temp)
+        with self._lock:
+            try:
+                self._size -= os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+            os.replace(temp, path)
+            self._size += size
+            self._written += size
+            if self._size > self.max_bytes or self._written > self.max_bytes // 16:
+                # Other processes may have written in the meantime
+                self._size = self._measure()
+                self._written = 0
+                if self._size > self.max_bytes:
+                    self._evict()
+        return path
+
+    def _evict(self):
+        entries = list()
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file() and entry.name.endswith(self.suffix):
+                    entries.append((entry.stat().st_mtime, entry))
+            except FileNotFoundError:
+                pass
+        entries = [entry for _, entry in sorted(entries, key=lambda e: e[0])]
+        # Keep the newest entry even when it is on its own larger than the cap
+        for entry in entries[:-1]:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._size -= size
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'bytes': self._size}
+
+
+class GraphCache(LRUFileCache):
+    """
+    Caches the graphs read from .dot files in the binary format, keyed by path, modification time and size, or with
+    by_content by a hash of the file content.
+    """
+
+    def __init__(self, directory: str = DEFAULT_GRAPH_CACHE, max_bytes: int = 2 * 1024 ** 3, by_content: bool = False):
+        super(GraphCache, self).__init__(directory, max_bytes, suffix=BINARY_SUFFIX)
+        self.by_content = by_content
+
+    def key(self, location: str) -> str:
+        digest = hashlib.sha1()
+        if self.by_content:
+            with open(location, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+        else:
+            stat = os.stat(location)
+            digest.update(('%s\0%d\0%d' % (os.path.abspath(location), stat.st_mtime_ns, stat.st_size)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def read(self, location: str) -> nx.MultiDiGraph:
+        key = self.key(location)
+        path = self.get(key)
+        if path is not None:
+            try:
+                return read_binary_graph(path)
+            except (OSError, ValueError, KeyError):
+                # Removed by another process or cut short, fall through and parse again
+                pass
+        graph = read_nxgraph_from_dot(location)
+        self.put(key, lambda temp: write_binary_graph(graph, temp))
+        return graph
+
+
+def git_blob_sha(location: str) -> str:
+    """
+    The SHA-1 git gives the content of the file at location, without calling git.
+    """
+    with open(location, 'rb') as f:
+        content = f.read()
+    digest = hashlib.sha1(b'blob %d\0' % len(content))
+    digest.update(content)
+    return digest.hexdigest()
+
+
+class PdgCache(LRUFileCache):
+    """
+    Caches the .dot files written by PdgGenerator, with the nameflow edges already added. Entries are keyed by the blob
+    SHA of the source file, its path in the repository, the extractor (path, size and modification time, so a rebuilt
+    extractor starts from scratch), the language and the blob SHA of the nameflows.json the edges came from.
+    """
+
+    def __init__(self, directory: str = DEFAULT_PDG_CACHE, max_bytes: int = 2 * 1024 ** 3):
+        super(PdgCache, self).__init__(directory, max_bytes, suffix='.dot')
+        self._extractors = dict()
+        self._nameflows = dict()
+
+    def extractor_version(self, extractor_location: str) -> str:
+        try:
+            return self._extractors[extractor_location]
+        except KeyError:
+            pass
+        try:
+            stat = os.stat(extractor_location)
+            version = '%s\0%d\0%d' % (os.path.abspath(extractor_location), stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            version = extractor_location
+        self._extractors[extractor_location] = version
+        return version
+
+    def nameflows_version(self, nameflows_location: str) -> str:
+        """
+        The blob SHA of the nameflows.json at nameflows_location, only hashed again once its size or modification time
+        changed; empty when there is none.
+        """
+        try:
+            stat = os.stat(nameflows_location)
+        except FileNotFoundError:
+            return ''
+        stamp = (os.path.abspath(nameflows_location), stat.st_size, stat.st_mtime_ns)
+        try:
+            return self._nameflows[stamp]
+        except KeyError:
+            pass
+        version = git_blob_sha(nameflows_location)
+        self._nameflows[stamp] = version
+        return version
+
+    def key(self, location: str, filename: str, extractor_location: str, src_code: str,
+            nameflows_location: str = None) -> str:
+        nameflows = self.nameflows_version(nameflows_location) if nameflows_location is not None else ''
+        digest = hashlib.sha1()
+        digest.update(('%s\0%s\0%s\0%s\0%s' % (git_blob_sha(location), os.path.normpath(filename),
+                                                  self.extractor_version(extractor_location), src_code,
+                                                  nameflows)).encode('utf-8'))
+        return digest.hexdigest()
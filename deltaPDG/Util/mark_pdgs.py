@@ -1,35 +1,55 @@
+from bisect import bisect_left
 from typing import List, Tuple
 
 import networkx as nx
-import pygraphviz
 
 
-def mark_pdg_nodes(apdg, marker: str,
-                   diff: List[Tuple[str, str, int, int, str]]) -> pygraphviz.AGraph:
-    marked_pdg = apdg.copy()
+def changed_lines(diff: List[Tuple[str, str, int, int, str]], marker: str) -> List[int]:
+    """
+    The sorted line numbers changed on the marker ('+' after, '-' before) side of the diff.
+    """
     index = 2 if marker == '+' else 3
+    return sorted({l[index] for l in diff if l[0] == marker})
+
+
+def span_changed(lines: List[int], start: int, end: int) -> bool:
+    """
+    Whether any of the sorted lines falls within start..end (inclusive).
+    """
+    i = bisect_left(lines, start)
+    return i < len(lines) and lines[i] <= end
+
+
+def mark_pdg_nodes(apdg, marker: str,
+                   diff: List[Tuple[str, str, int, int, str]], copy: bool = True) -> nx.MultiDiGraph:
+    """
+    Colour the nodes of apdg whose span holds a changed line. The changes are made to apdg as well as to the returned
+    copy, with copy=False apdg itself is marked and returned.
+    """
+    marked_pdg = apdg.copy() if copy else apdg
     change_label = 'green' if marker == '+' else 'red'
     anchor_label = 'orange'
-    diff_ = [(l[0], l[1], l[index], l[-1]) for l in diff]
-    c_diff = [ln for m, f, ln, line in diff_ if m == marker]
+    c_diff = changed_lines(diff, marker)
     # a_diff = [ln for m, f, ln, line in diff_ if m == ' ']
     for node, data in marked_pdg.nodes(data=True):
         if 'Entry' in data['label'] or 'Exit' in data['label']:
             attr = data
             attr['label'] += ' %s' % data['cluster']
-            apdg.add_node(node, **attr)
+            if copy:
+                apdg.add_node(node, **attr)
             continue  # Do not mark entry and exit nodes.
         try:
             start, end = [int(ln) for ln in data['span'].split('-') if '-' in data['span']]
         except ValueError:
             continue
         # We will use the changed nodes as anchors via neighbours
-        change = any([start <= cln - 0 <= end for cln in c_diff])
+        change = span_changed(c_diff, start, end)
         # anchor = any([start <= aln - 1 <= end for aln in a_diff])
         if change:
             attr = data
             attr['color'] = change_label if change else anchor_label
-            apdg.add_node(node, **attr)
+            if copy:
+                apdg.add_node(node, **attr)
 
     # print("This is the marked pdg:", marked_pdg)
     # nx.drawing.nx_pydot.write_dot(marked_pdg, 'marked_pdg.dot')
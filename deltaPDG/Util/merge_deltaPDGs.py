@@ -5,7 +5,7 @@ import os
 import networkx as nx
 
 from Util.general_util import get_pattern_paths
-from deltaPDG.Util.pygraph_util import read_graph_from_dot, obj_dict_to_networkx, get_context_from_nxgraph
+from deltaPDG.Util.pygraph_util import read_nxgraph_from_dot, get_context_from_nxgraph
 from deltaPDG.deltaPDG import quote_label
 
 
@@ -46,12 +46,12 @@ def merge_deltas_for_a_commit(graph_locations):
     # We will use the file attribute to track original files so that diff intersection can be made to work
     original_file = os.path.basename(graph_locations[0])
     # We will take the first graph as a base and add the rest onto it
-    graph = obj_dict_to_networkx(read_graph_from_dot(graph_locations[0]))
+    graph = read_nxgraph_from_dot(graph_locations[0])
     contexts = get_context_from_nxgraph(graph)
     output = graph.copy()
     graph_locations = graph_locations[1:]
     for i, graph_location in enumerate(graph_locations):
-        next_graph = obj_dict_to_networkx(read_graph_from_dot(graph_location))
+        next_graph = read_nxgraph_from_dot(graph_location)
         next_contexts = get_context_from_nxgraph(next_graph)
         # First find the contexts that exist in both
         mappable_contexts = list()
@@ -1,4 +1,17 @@
-from deltaPDG.Util.equivalence_util import Eq_Utils
+import logging
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+from deltaPDG.Util.equivalence_util import Eq_Utils, NeighbourIndex, cdist
+
+# Block key of nodes outside any method, kept apart from a cluster named ''
+_NO_CLUSTER = object()
+
+
+def _unmarked(data) -> bool:
+    return not ('color' in data.keys() and data['color'] != 'orange')
 
 
 class Marked_Merger(object):
@@ -6,57 +19,179 @@ class Marked_Merger(object):
         self.m_fuzziness = m_fuzziness
         self.n_fuzziness = n_fuzziness
         self.eq_utils = Eq_Utils(m_fuzziness, n_fuzziness)
+        # Timing and sizes of the last merge
+        self.stats = dict()
 
-    def __call__(self, before_apdg, after_apdg):
-        before_apdg = before_apdg.copy()
-        if before_apdg is None:
-            return after_apdg
-        after_apdg = after_apdg.copy()
+    def equivalent(self, before_apdg, node, data, after_apdg, other_node, other_data, before_index: NeighbourIndex,
+                   after_index: NeighbourIndex) -> bool:
+        equivalent = self.eq_utils.node_eq(before_apdg, node, after_apdg, other_node, before_index, after_index)
+        try:
+            equivalent = equivalent \
+                         and self.eq_utils.context_eq(data['cluster'], other_data['cluster'])
+        except KeyError:
+            equivalent = equivalent \
+                         and 'cluster' not in data.keys() \
+                         and 'cluster' not in other_data.keys()
+        return equivalent
+
+    def match_all_pairs(self, before_apdg, after_apdg):
+        """
+        Greedily map every unmarked before node to the first equivalent unmarked after node not mapped yet.
+        """
         label_map_ab = dict()
         label_map_ba = dict()
+        before_index = NeighbourIndex(before_apdg)
+        after_index = NeighbourIndex(after_apdg)
 
         for node, data in before_apdg.nodes(data=True):
-            if 'color' in data.keys() and data['color'] != 'orange':
+            if not _unmarked(data):
                 continue
             for other_node, other_data in after_apdg.nodes(data=True):
                 if other_node in label_map_ba.keys():
                     continue
-                if 'color' in other_data.keys() and other_data['color'] != 'orange':
+                if not _unmarked(other_data):
+                    continue
+                if self.equivalent(before_apdg, node, data, after_apdg, other_node, other_data, before_index,
+                                   after_index):
+                    label_map_ab[str(node)] = str(other_node)
+                    label_map_ba[str(other_node)] = str(node)
+                    break
+        return label_map_ab, label_map_ba
+
+    def match_scored(self, before_apdg, after_apdg):
+        """
+        The same mapping as match_all_pairs, with the label and cluster similarities of all unmarked nodes scored up
+        front in batches. Each before node then only visits, in graph order, the after nodes whose label and cluster
+        are close enough.
+        """
+        label_map_ab = dict()
+        label_map_ba = dict()
+        before_index = NeighbourIndex(before_apdg)
+        after_index = NeighbourIndex(after_apdg)
+        before_nodes = [(n, d) for n, d in before_apdg.nodes(data=True) if _unmarked(d)]
+        after_nodes = [(n, d) for n, d in after_apdg.nodes(data=True) if _unmarked(d)]
+
+        labels = self.eq_utils.label_matrix([d['label'] for _, d in before_nodes], [d['label'] for _, d in after_nodes])
+        contexts = self.eq_utils.context_matrix([d['cluster'] for _, d in before_nodes if 'cluster' in d.keys()],
+                                                [d['cluster'] for _, d in after_nodes if 'cluster' in d.keys()])
+        with_label = [list() for _ in range(len(labels.index_b))]
+        for position, (_, other_data) in enumerate(after_nodes):
+            with_label[labels.index_b[other_data['label']]].append(position)
+        # Cluster of every after node as an index into contexts, -1 for nodes without one
+        after_clusters = np.asarray([contexts.index_b[d['cluster']] if 'cluster' in d.keys() else -1
+                                     for _, d in after_nodes], dtype=np.int64)
+        no_cluster = after_clusters == -1
+        close_labels = dict()
+        mapped = set()
+
+        for node, data in before_nodes:
+            try:
+                candidates = close_labels[data['label']]
+            except KeyError:
+                candidates = [p for j in labels.candidates(data['label']) for p in with_label[j]]
+                candidates = np.sort(np.asarray(candidates, dtype=np.int64))
+                close_labels[data['label']] = candidates
+            if 'cluster' in data.keys():
+                # The extra False is picked by the -1 of after nodes without a cluster
+                close_clusters = np.append(contexts.matrix[contexts.index_a[data['cluster']]], False)
+                candidates = candidates[close_clusters[after_clusters[candidates]]]
+            else:
+                candidates = candidates[no_cluster[candidates]]
+            for position in candidates.tolist():
+                if position in mapped:
                     continue
-                equivalent = self.eq_utils.node_eq(before_apdg, node, after_apdg, other_node)
-                try:
-                    equivalent = equivalent \
-                                 and self.eq_utils.context_eq(data['cluster'], other_data['cluster'])
-                except KeyError:
-                    equivalent = equivalent \
-                                 and 'cluster' not in data.keys() \
-                                 and 'cluster' not in other_data.keys()
-                if equivalent:
+                other_node = after_nodes[position][0]
+                if self.eq_utils.node_eq(before_apdg, node, after_apdg, other_node, before_index, after_index,
+                                         label_eq=labels.eq):
+                    label_map_ab[str(node)] = str(other_node)
+                    label_map_ba[str(other_node)] = str(node)
+                    mapped.add(position)
+                    break
+        return label_map_ab, label_map_ba
+
+    def match_blocked(self, before_apdg, after_apdg):
+        """
+        The same mapping as match_all_pairs when both fuzziness levels are 100. A score of 100 needs identical strings,
+        so only after nodes with the same label and cluster can be equivalent: candidates are bucketed on those, in
+        graph order, and a mapped node leaves its bucket.
+        """
+        label_map_ab = dict()
+        label_map_ba = dict()
+        before_index = NeighbourIndex(before_apdg)
+        after_index = NeighbourIndex(after_apdg)
+
+        blocks = defaultdict(list)
+        for other_node, other_data in after_apdg.nodes(data=True):
+            if _unmarked(other_data):
+                blocks[(other_data.get('cluster', _NO_CLUSTER), other_data['label'])].append(other_node)
+
+        for node, data in before_apdg.nodes(data=True):
+            if not _unmarked(data):
+                continue
+            block = blocks.get((data.get('cluster', _NO_CLUSTER), data['label']))
+            if not block:
+                continue
+            for i, other_node in enumerate(block):
+                if self.equivalent(before_apdg, node, data, after_apdg, other_node, after_apdg.nodes[other_node],
+                                   before_index, after_index):
                     label_map_ab[str(node)] = str(other_node)
                     label_map_ba[str(other_node)] = str(node)
+                    del block[i]
                     break
+        return label_map_ab, label_map_ba
+
+    def __call__(self, before_apdg, after_apdg, copy_before: bool = True, copy_after: bool = True):
+        """
+        Merge the marked after graph into the marked before graph. Both graphs are modified unless copied first, pass
+        copy_before/copy_after=False for graphs the caller no longer needs.
+        """
+        t0 = time.perf_counter()
+        if copy_before:
+            before_apdg = before_apdg.copy()
+        if before_apdg is None:
+            return after_apdg
+        if copy_after:
+            after_apdg = after_apdg.copy()
+        before_size = (before_apdg.number_of_nodes(), before_apdg.number_of_edges())
+        after_size = (after_apdg.number_of_nodes(), after_apdg.number_of_edges())
+        if self.m_fuzziness == self.n_fuzziness == 100 \
+                and all('label' in d.keys() for _, d in before_apdg.nodes(data=True) if _unmarked(d)) \
+                and all('label' in d.keys() for _, d in after_apdg.nodes(data=True) if _unmarked(d)):
+            label_map_ab, label_map_ba = self.match_blocked(before_apdg, after_apdg)
+        elif cdist is not None \
+                and all(isinstance(d.get('label'), str) for _, d in before_apdg.nodes(data=True) if _unmarked(d)) \
+                and all(isinstance(d.get('label'), str) for _, d in after_apdg.nodes(data=True) if _unmarked(d)):
+            label_map_ab, label_map_ba = self.match_scored(before_apdg, after_apdg)
+        else:
+            label_map_ab, label_map_ba = self.match_all_pairs(before_apdg, after_apdg)
+
         # Visit anchors, explore neighbourhood and copy over nodes
         # Each node copied: add to a list to be explored
         # As each node is explored add copied nodes
         # Stop when list is empty
         # Boot strap list with all marked nodes in v2
-        to_visit = [str(node) for node in after_apdg.nodes() if
-                    'color' in after_apdg.nodes[node].keys() and after_apdg.nodes[node]['color'] != 'orange']
-        # print(to_visit)
-        visited = list()
+        to_visit = deque(str(node) for node in after_apdg.nodes() if
+                         'color' in after_apdg.nodes[node].keys() and after_apdg.nodes[node]['color'] != 'orange')
+        queued = set(to_visit)
+        visited = set()
 
-        work_to_be_done = len(to_visit) > 0
-        # counter = 1
+        # Every node is imported at most once and only queues its neighbours when it is, so this bounds the number
+        # of iterations of a converging run
+        max_iterations = after_size[0] + 2 * after_size[1] + 1
+        iterations = 0
         # We fixed-point compute this due to the fact that we leave potentially dangling edges, 
         # so we iterate until all edges point to real nodes
-        while work_to_be_done:
-            # print(to_visit)
-            # print(visited)
-            node_id = to_visit[0]
+        while to_visit:
+            iterations += 1
+            if iterations > max_iterations:
+                logging.warning('Marked_Merger did not converge after %d iterations, %d nodes left to visit'
+                                % (max_iterations, len(to_visit)))
+                break
+            node_id = to_visit.popleft()
+            queued.discard(node_id)
             node_id = node_id.replace('n', 'd') if node_id not in label_map_ba.keys() else label_map_ba[node_id]
 
-            to_visit = to_visit[1:]
-            if not (before_apdg.has_node(node_id) and 'label' in before_apdg.node[node_id].keys()):
+            if not (before_apdg.has_node(node_id) and 'label' in before_apdg.nodes[node_id].keys()):
                 # Find node in after graph and visit if not visited (sanity check)
                 other_node = 'n' + node_id[1:]
                 if other_node not in visited:
@@ -69,7 +204,9 @@ class Marked_Merger(object):
                         in_, _, key = in_edge
                         if in_ not in label_map_ba.keys():
                             in_id = str(in_).replace('n', 'd')
-                            if in_ not in to_visit and in_ not in visited: to_visit.append(in_)
+                            if in_ not in queued and in_ not in visited:
+                                to_visit.append(in_)
+                                queued.add(in_)
                         else:
                             in_id = label_map_ba[str(in_)]
                         if before_apdg.has_edge(in_id, node_id, key):
@@ -89,7 +226,9 @@ class Marked_Merger(object):
                         _, out_, key = out_edge
                         if out_ not in label_map_ba.keys():
                             out_id = str(out_).replace('n', 'd')
-                            if out_ not in to_visit and out_ not in visited: to_visit.append(out_)
+                            if out_ not in queued and out_ not in visited:
+                                to_visit.append(out_)
+                                queued.add(out_)
                         else:
                             out_id = label_map_ba[str(out_)]
                         if before_apdg.has_edge(node_id, out_id, key):
@@ -102,8 +241,7 @@ class Marked_Merger(object):
                             before_apdg.add_edge(node_id, out_id, key,
                                                  **after_apdg[other_node][out_][key])
                             after_apdg.remove_edge(other_node, out_, key)
-                    visited.append(other_node)
-            work_to_be_done = len(to_visit) > 0
+                    visited.add(other_node)
 
         for node in before_apdg.nodes():
             if 'color' in before_apdg.nodes[node].keys():
@@ -162,4 +300,17 @@ class Marked_Merger(object):
                         if not (after_apdg.has_edge(other_node, after_node)):
                             before_apdg[source][sink][key]['color'] = 'red'
 
+        self.stats = {
+            'time': time.perf_counter() - t0,
+            'before': before_size,
+            'after': after_size,
+            'merged': (before_apdg.number_of_nodes(), before_apdg.number_of_edges()),
+            'matched': len(label_map_ab),
+            'imported': len(visited),
+            'iterations': iterations,
+        }
+        logging.info('Merged %d/%d before and %d/%d after nodes/edges into %d/%d (%d matched, %d imported, '
+                     '%d iterations) in %.2fs'
+                     % (before_size + after_size + self.stats['merged']
+                        + (len(label_map_ab), len(visited), iterations, self.stats['time'])))
         return before_apdg
@@ -1,33 +1,74 @@
-from typing import Dict, List, Any
+import heapq
+from typing import Dict, List, Any, Iterable, Optional
 
 
-def find_node_in_graph(node: Any, apdg):
+class SpanIndex(object):
+    """
+    Answers which is the first node of a PDG, in graph order, whose span contains a given line.
+    Nodes whose span is missing or is not of the form start-end are never matched.
+    """
+
+    def __init__(self, apdg):
+        self.intervals = list()
+        for order, (node_pdg, data) in enumerate(apdg.nodes(data=True)):
+            span = data.get('span', '')
+            if '-' not in span:
+                continue
+            try:
+                start, end = span.split('-')
+                self.intervals.append((int(start), int(end), order, node_pdg))
+            except ValueError:
+                continue
+        self.intervals.sort()
+        self.resolved = dict()
+
+    def resolve(self, lines: Iterable[int]) -> Dict[int, Any]:
+        """
+        Resolve all lines in a single sweep over the spans sorted by start, keeping the spans that started so far in a
+        heap ordered by node position. Spans that ended before the current line are dropped lazily from the top.
+        """
+        pending = sorted({line for line in lines if line not in self.resolved})
+        started = list()
+        i = 0
+        for line in pending:
+            while i < len(self.intervals) and self.intervals[i][0] <= line:
+                start, end, order, node_pdg = self.intervals[i]
+                heapq.heappush(started, (order, end, node_pdg))
+                i += 1
+            while started and started[0][1] < line:
+                heapq.heappop(started)
+            self.resolved[line] = started[0][2] if started else None
+        return self.resolved
+
+    def find(self, line: int) -> Optional[Any]:
+        if line not in self.resolved:
+            self.resolve([line])
+        return self.resolved[line]
+
+
+def find_node_in_graph(node: Any, apdg, index: SpanIndex = None):
     if not node['Infile']: return None
-    pdg_node = None
-    for node_pdg, data in apdg.nodes(data=True):
-        if '-' not in data['span']:
-            continue
-        start, end = data['span'].split('-')
-        is_in_span = int(start) <= int(node['Location'][1]) <= int(end)
-        if is_in_span:
-            pdg_node = node_pdg
-            break
-    return pdg_node
-
-
-def add_nameflow_edges(nameflow_data: Dict[str, List[Any]], apdg):
-    apdg = apdg.copy()
+    if index is None:
+        index = SpanIndex(apdg)
+    return index.find(int(node['Location'][1]))
+
+
+def add_nameflow_edges(nameflow_data: Dict[str, List[Any]], apdg, copy: bool = True):
+    if copy:
+        apdg = apdg.copy()
     if nameflow_data is not None:
+        index = SpanIndex(apdg)
+        index.resolve(int(node['Location'][1]) for node in nameflow_data['nodes'] if node['Infile'])
+        pdg_nodes = [find_node_in_graph(node, apdg, index) for node in nameflow_data['nodes']]
         for i in range(len(nameflow_data['nodes'])):
             node = nameflow_data['nodes'][i]
             relations = nameflow_data['relations'][i]
-            pdg_node = find_node_in_graph(node, apdg)
+            pdg_node = pdg_nodes[i]
             if pdg_node:
                 for relation in relations:
                     if relation == -1:
                         continue
-                    other_node = nameflow_data['nodes'][relation]
-                    other_pdg_node = find_node_in_graph(other_node, apdg)
+                    other_pdg_node = pdg_nodes[relation]
                     if other_pdg_node:
                         apdg.add_edge(pdg_node, other_pdg_node, key=3, color='darkorchid', style='bold',
                                       label='%s %s %s %s' %
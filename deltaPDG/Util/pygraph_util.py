@@ -3,6 +3,10 @@ from typing import Tuple, Dict
 import networkx as nx
 import pydot
 
+from deltaPDG.Util.binary_graph import BINARY_SUFFIX, read_binary_graph
+from deltaPDG.Util.corpus_store import CorpusEntry
+from deltaPDG.Util.dot_reader import parse_dot
+
 
 def read_graph_from_dot(file_: str) -> Tuple[Dict, Dict[str, str]]:
     try:
@@ -14,6 +18,32 @@ def read_graph_from_dot(file_: str) -> Tuple[Dict, Dict[str, str]]:
     return apdg
 
 
+def read_nxgraph_from_dot(file_: str) -> nx.MultiDiGraph:
+    """
+    Equivalent to obj_dict_to_networkx(read_graph_from_dot(file_)) without going through pydot.
+    """
+    with open(file_, encoding='utf-8-sig') as f:
+        try:
+            return parse_dot(f.read())
+        except ValueError:
+            print('Error reading %s' % file_)
+            return nx.MultiDiGraph()
+
+
+def read_delta_graph(location, cache=None) -> nx.MultiDiGraph:
+    """
+    Read a deltaPDG stored as a .dot file, in the binary format of binary_graph.py or as an entry of a corpus store.
+    :param cache: An optional graph_cache.GraphCache through which .dot files are read
+    """
+    if isinstance(location, CorpusEntry):
+        return location.load()
+    if location.endswith(BINARY_SUFFIX):
+        return read_binary_graph(location)
+    if cache is not None:
+        return cache.read(location)
+    return read_nxgraph_from_dot(location)
+
+
 def obj_dict_to_networkx(obj_dict):
     graph = nx.MultiDiGraph()
 
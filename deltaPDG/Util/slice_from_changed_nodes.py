@@ -41,8 +41,8 @@ def slice_delta(graph):
 
 
 if __name__ == '__main__':
-    from deltaPDG.Util.pygraph_util import read_graph_from_dot, obj_dict_to_networkx
+    from deltaPDG.Util.pygraph_util import read_nxgraph_from_dot
 
-    graph = obj_dict_to_networkx(read_graph_from_dot('./out/gui.cs/gui.cs.dot'))
+    graph = read_nxgraph_from_dot('./out/gui.cs/gui.cs.dot')
     slice = slice_delta(graph)
     nx.drawing.nx_pydot.write_dot(slice, './out/gui.cs/sliced_gui.cs.dot')
@@ -199,8 +199,8 @@ def compress_delta(graph, node_context_size=1, line_context_size=3):
 
 
 if __name__ == '__main__':
-    from deltaPDG.Util.pygraph_util import read_graph_from_dot, obj_dict_to_networkx
+    from deltaPDG.Util.pygraph_util import read_nxgraph_from_dot
 
-    graph = obj_dict_to_networkx(read_graph_from_dot('./out/gui.cs/Core.cs.dot'))
+    graph = read_nxgraph_from_dot('./out/gui.cs/Core.cs.dot')
     compressed = compress_delta(graph)
     nx.drawing.nx_pydot.write_dot(compressed, './out/gui.cs/compressed_Core.cs.dot')
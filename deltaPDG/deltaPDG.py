@@ -1,30 +1,42 @@
-from typing import List, Tuple
+from typing import List, Tuple, Union
 
 import networkx as nx
 
 from .Util.mark_pdgs import mark_pdg_nodes
 from .Util.merge_marked_pdgs import Marked_Merger
-from .Util.pygraph_util import read_graph_from_dot, obj_dict_to_networkx
+from .Util.pygraph_util import read_nxgraph_from_dot
 
 
 class deltaPDG(object):
-    def __init__(self, base_pdg_location: str, m_fuzziness: int, n_fuzziness: int):
-        self.before_pdg = self.reset_nodes_labels(obj_dict_to_networkx(read_graph_from_dot(base_pdg_location)))
+    """
+    Both PDGs can be given as the location of a .dot file or as an already read graph. A graph is never modified, the
+    relabelling works on a copy, so callers can keep reusing it.
+    """
+
+    def __init__(self, base_pdg: Union[str, nx.MultiDiGraph], m_fuzziness: int, n_fuzziness: int):
+        self.before_pdg = self.load(base_pdg)
         self.merger = Marked_Merger(m_fuzziness=m_fuzziness, n_fuzziness=n_fuzziness)
 
-    def __call__(self, target_pdg_location: str, diff: List[Tuple[str, str, int, int, str]]):
-        after_pdg = self.reset_nodes_labels(obj_dict_to_networkx(read_graph_from_dot(target_pdg_location)))
+    def __call__(self, target_pdg: Union[str, nx.MultiDiGraph], diff: List[Tuple[str, str, int, int, str]]):
+        after_pdg = self.load(target_pdg)
         # nx.drawing.nx_pydot.write_dot(after_pdg, './temp/after.dot')
-        marked_before = mark_pdg_nodes(self.before_pdg, '-', diff)
-        marked_after = mark_pdg_nodes(after_pdg, '+', diff)
-        self.deltaPDG = self.merger(before_apdg=marked_before, after_apdg=marked_after)
+        # Marking has always been applied to the base graph too, so mark it in place rather than mark a copy.
+        # The merger still copies it, so this object can be called again, but takes over the after graph.
+        marked_before = mark_pdg_nodes(self.before_pdg, '-', diff, copy=False)
+        marked_after = mark_pdg_nodes(after_pdg, '+', diff, copy=False)
+        self.deltaPDG = self.merger(before_apdg=marked_before, after_apdg=marked_after, copy_after=False)
         # nx.drawing.nx_pydot.write_dot(self.deltaPDG, './temp/delta_pdg.dot')
         return self.deltaPDG
 
-    def reset_nodes_labels(self, pdg):
-        pdg_integers = nx.convert_node_labels_to_integers(pdg)
-        pdg_reset = nx.relabel_nodes(pdg_integers, lambda n: 'n' + str(n))
-        return pdg_reset
+    @staticmethod
+    def load(pdg: Union[str, nx.MultiDiGraph]) -> nx.MultiDiGraph:
+        if not isinstance(pdg, nx.Graph):
+            pdg = read_nxgraph_from_dot(pdg)
+        return deltaPDG.reset_nodes_labels(pdg)
+
+    @staticmethod
+    def reset_nodes_labels(pdg):
+        return nx.relabel_nodes(pdg, {node: 'n%d' % i for i, node in enumerate(pdg.nodes)})
 
 
 def quote_label(pdg: nx.Graph):
@@ -1,4 +1,3 @@
-import os
 import time
 from threading import Thread
 from typing import List
@@ -8,7 +7,8 @@ import numpy as np
 from tqdm import tqdm
 
 from Util.evaluation import evaluate
-from deltaPDG.Util.pygraph_util import read_graph_from_dot, obj_dict_to_networkx
+from deltaPDG.Util.corpus_store import datapoint_of
+from deltaPDG.Util.pygraph_util import read_delta_graph
 
 
 # Data-Use Chains
@@ -77,7 +77,7 @@ def closure_of_DU_on_diff(graph):
     return graph
 
 
-def validate(files: List[str], times, repository_name):
+def validate(files: List, times, repository_name, graph_cache=None):
     n_workers = 4
     chunck_size = int(len(files) / n_workers)
     while chunck_size == 0:
@@ -87,9 +87,8 @@ def validate(files: List[str], times, repository_name):
 
     def worker(work):
         for graph_location in tqdm(work, leave=False):
-            chain = os.path.basename(os.path.dirname(os.path.dirname(graph_location)))
-            q = int(os.path.basename(os.path.dirname(graph_location)))
-            graph = obj_dict_to_networkx(read_graph_from_dot(graph_location))
+            chain, q = datapoint_of(graph_location)
+            graph = read_delta_graph(graph_location, graph_cache)
 
             t0 = time.process_time()
             for i in range(times):
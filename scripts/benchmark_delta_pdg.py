@@ -0,0 +1,105 @@
+"""
+Compares building a deltaPDG the way it used to be done, copying the graph at every stage, with the copy-free pipeline.
+
+Usage: python scripts/benchmark_delta_pdg.py [number of statements] [repetitions]
+
+Both pipelines start from the same synthetic before/after PDGs (with nameflow data and a diff) and produce the same
+graph; time and peak traced memory are reported per pipeline.
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import networkx as nx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deltaPDG.Util.mark_pdgs import mark_pdg_nodes
+from deltaPDG.Util.merge_marked_pdgs import Marked_Merger
+from deltaPDG.Util.merge_nameflow import add_nameflow_edges
+from deltaPDG.deltaPDG import deltaPDG
+from tangle_concerns.generate_corpus import mark_originating_commit
+
+
+def synthetic_pdg(statements: int, changed: set, seed: int) -> nx.MultiDiGraph:
+    rng = random.Random(seed)
+    pdg = nx.MultiDiGraph()
+    methods = max(1, statements // 25)
+    for m in range(methods):
+        pdg.add_node('e%d' % m, label='Entry C.m%d()' % m, span='%d-%d' % (m * 25, m * 25), cluster='C.m%d' % m)
+        pdg.add_node('x%d' % m, label='Exit C.m%d()' % m, span='%d-%d' % (m * 25, m * 25), cluster='C.m%d' % m)
+    for s in range(statements):
+        line = s + s // 25 + 1
+        label = 'var v%d = v%d + %d;' % (s, s - 1, (s * 7) % 13 if line not in changed else seed)
+        pdg.add_node('s%d' % s, label=label, span='%d-%d' % (line, line), cluster='C.m%d' % (s // 25 % methods))
+    nodes = list(pdg.nodes)
+    for _ in range(3 * statements):
+        pdg.add_edge(rng.choice(nodes), rng.choice(nodes), key=rng.choice(['0', '1', '2']), style='solid')
+    return pdg
+
+
+def synthetic_nameflow(statements: int, seed: int):
+    rng = random.Random(seed)
+    nodes = [{'Infile': True, 'Location': ('C.cs', str(rng.randint(1, statements))), 'symbolKind': 'Local',
+              'kind': 'Use', 'type': 'int', 'name': 'v%d' % i} for i in range(statements // 4)]
+    relations = [[rng.randrange(len(nodes))] for _ in nodes]
+    return {'nodes': nodes, 'relations': relations}
+
+
+def legacy(before, after, nameflow, diff, marked_diff):
+    def reset(pdg):
+        return nx.relabel_nodes(nx.convert_node_labels_to_integers(pdg), lambda n: 'n' + str(n))
+
+    before = reset(add_nameflow_edges(nameflow, before))
+    after = reset(add_nameflow_edges(nameflow, after))
+    marked_before = mark_pdg_nodes(before, '-', diff)
+    marked_after = mark_pdg_nodes(after, '+', diff)
+    delta = Marked_Merger(100, 100)(marked_before, marked_after)
+    return mark_originating_commit(delta, marked_diff, '/C.cs')
+
+
+def copy_free(before, after, nameflow, diff, marked_diff):
+    before = deltaPDG.reset_nodes_labels(add_nameflow_edges(nameflow, before, copy=False))
+    after = deltaPDG.reset_nodes_labels(add_nameflow_edges(nameflow, after, copy=False))
+    marked_before = mark_pdg_nodes(before, '-', diff, copy=False)
+    marked_after = mark_pdg_nodes(after, '+', diff, copy=False)
+    delta = Marked_Merger(100, 100)(marked_before, marked_after, copy_before=False, copy_after=False)
+    return mark_originating_commit(delta, marked_diff, '/C.cs', copy=False)
+
+
+def measure(pipeline, inputs):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = pipeline(*inputs)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+if __name__ == '__main__':
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    changed = set(random.Random(0).sample(range(1, statements), statements // 20))
+    diff = [('-', '/C.cs', -1, line, 'old') for line in sorted(changed)] \
+           + [('+', '/C.cs', line, -1, 'new') for line in sorted(changed)]
+    marked_diff = [change + (1,) for change in diff]
+
+    results = dict()
+    for name, pipeline in (('legacy', legacy), ('copy-free', copy_free)):
+        times, peaks = list(), list()
+        for _ in range(repetitions):
+            inputs = (synthetic_pdg(statements, changed, 1), synthetic_pdg(statements, changed, 2),
+                      synthetic_nameflow(statements, 3), diff, marked_diff)
+            result, elapsed, peak = measure(pipeline, inputs)
+            times.append(elapsed)
+            peaks.append(peak)
+        results[name] = result
+        print('%-10s %8.3fs  peak %7.1f MB' % (name, min(times), max(peaks) / 1024 ** 2))
+
+    same = list(results['legacy'].nodes(data=True)) == list(results['copy-free'].nodes(data=True)) \
+           and list(results['legacy'].edges(keys=True, data=True)) \
+           == list(results['copy-free'].edges(keys=True, data=True))
+    print('Identical output: %s' % same)
@@ -0,0 +1,66 @@
+"""
+Compares building the file/commit occurrence matrix with list lookups, the way it used to be done, with the
+dict-indexed construction in confidence_voters/Util/generate_corpus_file.py.
+
+Usage: python scripts/benchmark_occurrence_matrix.py [number of commits] [number of files]
+
+Both run on the same synthetic history, once with a file list that repeats files as build_occurrence_matrix used to
+produce it, and once deduplicated, and the time of each construction is reported. The matrix itself is pinned by
+tests/test_occurrence_matrix.py.
+"""
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from functools import reduce
+
+import scipy.sparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from confidence_voters.Util.generate_corpus_file import generate_occurrence_matrix
+
+
+def legacy(list_of_files, list_of_commits, file_commit_map):
+    indices = reduce(lambda p1, p2: (p1[0] + p2[0], p1[1] + p2[1]),
+                     map(lambda p: ([list_of_files.index(p[0])] * len(p[1]),
+                                    [list_of_commits.index(c) for c in p[1]]), file_commit_map.items()), ([], []))
+    return scipy.sparse.csc_matrix(([1] * len(indices[0]), indices), shape=(len(list_of_files), len(list_of_commits)))
+
+
+def synthetic_history(commits: int, files: int, seed: int):
+    rng = random.Random(seed)
+    names = ['/src/Module%d/File%d.cs' % (i % 50, i) for i in range(files)]
+    all_commits = ['%040x' % rng.getrandbits(160) for _ in range(commits)]
+    repeated_files = list()
+    file_commit_map = defaultdict(list)
+    for sha in all_commits:
+        # Most commits touch a few files, some touch many
+        touched = {rng.choice(names[:max(1, files // 10)] if rng.random() < .5 else names)
+                   for _ in range(min(files, int(rng.paretovariate(1.5))))}
+        for file in touched:
+            file_commit_map[file].append(sha)
+            repeated_files.append(file)
+    return repeated_files, all_commits, dict(file_commit_map)
+
+
+def same(a, b) -> bool:
+    return a.shape == b.shape and (a != b).nnz == 0
+
+
+if __name__ == '__main__':
+    commits = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    files = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    repeated_files, all_commits, file_commit_map = synthetic_history(commits, files, 0)
+    deduplicated = list(dict.fromkeys(repeated_files))
+    print('%d commits, %d files, %d occurrences' % (commits, len(deduplicated), len(repeated_files)))
+
+    for name, list_of_files in (('repeated files', repeated_files), ('deduplicated', deduplicated)):
+        t0 = time.perf_counter()
+        expected = legacy(list_of_files, all_commits, file_commit_map)
+        t1 = time.perf_counter()
+        result = generate_occurrence_matrix(list_of_files, all_commits, file_commit_map)
+        t2 = time.perf_counter()
+        print('%-15s legacy %8.3fs  dict-indexed %8.3fs  identical: %s'
+              % (name, t1 - t0, t2 - t1, same(expected, result)))
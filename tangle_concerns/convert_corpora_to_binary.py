@@ -0,0 +1,56 @@
+"""
+Converts every merged.dot of a cleaned corpus into the binary format read by the evaluation drivers' --binary flag, or
+with --store packs a whole corpus into the single archive read by their --store flag.
+"""
+import os
+import sys
+
+from tqdm import tqdm
+
+from Util.general_util import get_pattern_paths
+from deltaPDG.Util.binary_graph import BINARY_SUFFIX, write_binary_graph
+from deltaPDG.Util.corpus_store import corpus_store_location, datapoint_of, write_corpus_store
+from deltaPDG.Util.pygraph_util import read_nxgraph_from_dot
+
+
+def convert_corpus(corpus_location: str) -> int:
+    """
+    Write a binary copy next to each merged.dot under corpus_location, skipping copies that are up to date.
+    :return: The number of graphs converted
+    """
+    converted = 0
+    for graph_location in tqdm(get_pattern_paths('*merged.dot', corpus_location), leave=False):
+        binary_location = graph_location[:-len('.dot')] + BINARY_SUFFIX
+        if os.path.exists(binary_location) \
+                and os.path.getmtime(binary_location) >= os.path.getmtime(graph_location):
+            continue
+        write_binary_graph(read_nxgraph_from_dot(graph_location), binary_location)
+        converted += 1
+    return converted
+
+
+def pack_corpus(corpus_location: str, store_location: str) -> int:
+    """
+    Pack every merged.dot under corpus_location into one corpus store, in the order the drivers visit them.
+    :return: The number of graphs packed
+    """
+    def datapoints():
+        for graph_location in tqdm(sorted(get_pattern_paths('*merged.dot', corpus_location)), leave=False):
+            chain, q = datapoint_of(graph_location)
+            yield chain, q, graph_location, read_nxgraph_from_dot(graph_location)
+
+    return write_corpus_store(datapoints(), store_location)
+
+
+if __name__ == '__main__':
+    store = '--store' in sys.argv
+    if store:
+        sys.argv.remove('--store')
+    for corpus_name in sys.argv[1:]:
+        corpus_location = os.path.join('.', 'data', 'corpora_clean', corpus_name)
+        if store:
+            n = pack_corpus(corpus_location, corpus_store_location(corpus_name))
+            print('[Convert corpora] Packed %d graphs for %s' % (n, corpus_name))
+        else:
+            n = convert_corpus(corpus_location)
+            print('[Convert corpora] Converted %d graphs for %s' % (n, corpus_name))
@@ -1,14 +1,22 @@
 import argparse
+import hashlib
 import json
 import logging
 import os
-import sys
+import queue
+import threading
+import time
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
 from multiprocessing import Process
 import jsonpickle
 import networkx as nx
+from deltaPDG.Util.extractor_worker import start_extractor
 from deltaPDG.Util.generate_pdg import PdgGenerator
+from deltaPDG.Util.graph_cache import DEFAULT_PDG_CACHE, PdgCache
 from deltaPDG.Util.git_util import GitUtil
 from deltaPDG.Util.merge_deltaPDGs import merge_files_pdg
+from deltaPDG.Util.pygraph_util import read_nxgraph_from_dot
 from deltaPDG.deltaPDG import deltaPDG, quote_label
 from du_chains.DU_chains_closure import validate
 from tangle_concerns.tangle_by_file import tangle_by_file
@@ -20,11 +28,12 @@ logging.basicConfig(level=logging.INFO,
                     handlers=[logging.StreamHandler()])
 
 
-def mark_originating_commit(dpdg, marked_diff, filename):
+def mark_originating_commit(dpdg, marked_diff, filename, copy=True):
     """
-    Mark the nodes in the delta-pdg with the originating commit.
+    Mark the nodes in the delta-pdg with the originating commit, in place when copy is False.
     """
-    dpdg = dpdg.copy()
+    if copy:
+        dpdg = dpdg.copy()
     for node, data in dpdg.nodes(data=True):
         if 'color' in data.keys() and data['color'] != 'orange':
             start, end = [int(l) for l in data['span'].split('-')] if '-' in data['span'] else [-1, -1]
@@ -52,11 +61,93 @@ def mark_originating_commit(dpdg, marked_diff, filename):
                              if label in line and (start <= after_coord <= end or start <= before_coord <= end)],
                             default=0)
 
-            dpdg.node[node]['community'] = community
+            dpdg.nodes[node]['community'] = community
 
     return dpdg
 
 
+class ChainPdgCache(object):
+    """
+    The PDGs generated while working on one chain. The before side stays at from_^ for the whole chain, so its PDGs are
+    kept per file; after-side PDGs are kept per file and content, so files the latest cherry-pick did not change are
+    not extracted again. Call clear() when moving on to the next chain, and prepare() with the files of a step to
+    extract all the PDGs it is missing in one batch per version.
+    """
+
+    def __init__(self, v1_pdg_generator: PdgGenerator, v2_pdg_generator: PdgGenerator, src_code: str,
+                 workers: int = 1):
+        self.v1_pdg_generator = v1_pdg_generator
+        self.v2_pdg_generator = v2_pdg_generator
+        self.src_code = src_code
+        self.workers = workers
+        self.before_pdgs = dict()
+        self.after_pdgs = dict()
+        self.extracted = 0
+        self.reused = 0
+
+    def clear(self):
+        self.before_pdgs.clear()
+        self.after_pdgs.clear()
+        self.extracted = 0
+        self.reused = 0
+
+    def prepare(self, filenames):
+        missing = [f for f in filenames if f not in self.before_pdgs]
+        self.reused += len(filenames) - len(missing)
+        if missing:
+            for filename, pdg in self.v1_pdg_generator.batch(missing, self.src_code, self.workers).items():
+                self.before_pdgs[filename] = pdg if pdg is not None else nx.MultiDiGraph()
+            self.extracted += len(missing)
+
+        keys = {f: self._after_key(f) for f in filenames}
+        missing = [f for f, key in keys.items() if key not in self.after_pdgs]
+        self.reused += len(keys) - len(missing)
+        if missing:
+            for filename, pdg in self.v2_pdg_generator.batch(missing, self.src_code, self.workers).items():
+                self.after_pdgs[keys[filename]] = pdg if pdg is not None else nx.MultiDiGraph()
+            self.extracted += len(missing)
+
+    def before(self, filename: str) -> nx.MultiDiGraph:
+        try:
+            pdg = self.before_pdgs[filename]
+        except KeyError:
+            pdg = self.before_pdgs[filename] = self._generate(self.v1_pdg_generator, filename)
+        return pdg
+
+    def after(self, filename: str) -> nx.MultiDiGraph:
+        key = self._after_key(filename)
+        try:
+            pdg = self.after_pdgs[key]
+        except KeyError:
+            pdg = self.after_pdgs[key] = self._generate(self.v2_pdg_generator, filename)
+        return pdg
+
+    def _after_key(self, filename: str):
+        return filename, self._content_hash(self.v2_pdg_generator.repository_location + filename)
+
+    @staticmethod
+    def _content_hash(path: str):
+        try:
+            with open(path, 'rb') as f:
+                return hashlib.sha1(f.read()).hexdigest()
+        except FileNotFoundError:
+            return None
+
+    def _generate(self, generator: PdgGenerator, filename: str) -> nx.MultiDiGraph:
+        # The generator leaves the previous output in place when the file does not exist at this version, make sure
+        # that reads as an empty PDG rather than the PDG of another file
+        location = os.path.join(generator.target_location, generator.target_filename)
+        try:
+            os.remove(location)
+        except FileNotFoundError:
+            pass
+        generator(filename, src_code=self.src_code)
+        self.extracted += 1
+        if not os.path.exists(location):
+            return nx.MultiDiGraph()
+        return read_nxgraph_from_dot(location)
+
+
 def mark_origin(tangled_diff, atomic_diffs):
     """
     Marks which atomic change the change is associated with, returning a list of messages with the source marked.
@@ -73,90 +164,208 @@ def mark_origin(tangled_diff, atomic_diffs):
     return output
 
 
-def worker(work, subject_location, id_, temp_loc, extractor_location, src_code):
+class StageTimer(object):
+    """
+    Time spent and items handled per pipeline stage, shared by the threads of a worker.
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.items = defaultdict(int)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, items: int = 1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.seconds[name] += elapsed
+                self.items[name] += items
+
+    def report(self) -> str:
+        with self._lock:
+            return ', '.join('%s: %d in %.1fs (%.2f/s)' % (name, self.items[name], seconds, self.items[name] / seconds)
+                             if self.items[name] > 0 and seconds > 0 else '%s: %.1fs' % (name, seconds)
+                             for name, seconds in self.seconds.items())
+
+
+# One step of a chain, ready to be turned into deltaPDGs: pdgs maps every file still to build to its before and after
+# PDG, labeli_changes is a copy as the chain goes on adding to it
+Step = namedtuple('Step', ['changes', 'changes_by_file', 'labeli_changes', 'pdgs', 'output_paths'])
+
+
+def build_step(step: Step, method_fuzziness: int, node_fuzziness: int):
+    try:
+        marked_diff = mark_origin(step.changes, step.labeli_changes)
+    except Exception:
+        return
+    for filename, (before_pdg, after_pdg) in step.pdgs.items():
+        try:
+            output_path = step.output_paths[filename]
+            delta_gen = deltaPDG(before_pdg, m_fuzziness=method_fuzziness, n_fuzziness=node_fuzziness)
+            delta_pdg = delta_gen(after_pdg, step.changes_by_file[filename])
+            delta_pdg = mark_originating_commit(delta_pdg, marked_diff, filename, copy=False)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            # nx.set_node_attributes(delta_pdg, local_filename, "filepath")
+            # nx.drawing.nx_pydot.write_dot(quote_label(delta_pdg), output_path)
+            merge_files_pdg(output_path)
+        except Exception:
+            pass
+        # if len(files_touched) != 0:
+        #     merged_path = merge_files_pdg(out_dir)
+        #     clean_path = clean_graph(merged_path, repository_name)
+        #     validate([clean_path], 1, 1, repository_name)  # Flexeme's paper uses 1-hop clustering
+
+
+def build_steps(steps: queue.Queue, timer: StageTimer, method_fuzziness: int, node_fuzziness: int):
+    """
+    Consumer end of the worker pipeline, builds the deltaPDGs of the steps put in steps until it gets None.
+    """
+    while True:
+        with timer.stage('waiting for steps', items=0):
+            step = steps.get()
+        if step is None:
+            return
+        with timer.stage('build', items=len(step.pdgs)):
+            try:
+                build_step(step, method_fuzziness, node_fuzziness)
+            except Exception as e:
+                logging.error(f"Error building deltaPDGs: {e}")
+
+
+def worker(work, subject_location, id_, temp_loc, extractor_location, src_code,
+           pdg_cache_location=DEFAULT_PDG_CACHE, persistent_extractor=True, extractor_processes=1):
+    """
+    Runs as a two stage pipeline: this thread moves the repository along the chains and extracts the PDGs of every
+    step, while a second thread builds the deltaPDGs of the previous steps. The stages only share the steps handed
+    over through a bounded queue, so the builder never sees the repository change under it.
+    """
     repository_name = os.path.basename(subject_location)
     # Tolerance of a certain amount of disturbance in the PDG
     method_fuzziness = 100
     node_fuzziness = 100
 
-    git_handler = GitUtil(temp_dir=temp_loc)
-
-    with git_handler as gh:
-        v1 = gh.move_git_repo_to_tmp(subject_location)
-        v2 = gh.move_git_repo_to_tmp(subject_location)
-
-        os.makedirs('./temp/%d' % id_, exist_ok=True)
-        v1_pdg_generator = PdgGenerator(
-            repository_location=v1,
-            target_filename='before_pdg.dot',
-            target_location='./temp/%d' % id_,
-            extractor_location=extractor_location
-        )
-        v2_pdg_generator = PdgGenerator(
-            repository_location=v2,
-            target_filename='after_pdg.dot',
-            target_location='./temp/%d' % id_,
-            extractor_location=extractor_location)
-        for chain in work:
-            logging.info(f"Working on chain: {chain}")
-            from_ = chain[0]
-
-            gh.set_git_to_rev(from_ + '^', v1)
-            gh.set_git_to_rev(from_, v2)
-
-            labeli_changes = dict()
-            labeli_changes[0] = gh.process_diff_between_commits(from_ + '^', from_, v2)
-
-            previous_sha = from_
-            i = 1
-            for to_ in chain[1:]:
-                gh.cherry_pick_on_top(to_, v2)
-
-                changes = gh.process_diff_between_commits(from_ + '^', to_, v2)
-
-                labeli_changes[i] = gh.process_diff_between_commits(previous_sha, to_, v2)
-                i += 1
-                previous_sha = to_
-
-                # find all java files touched in the changes
-                # if use other languages, change the file extension
-                # cs for C#, py for Python, etc.
-                if src_code == 'java':
-                    files_touched = {filename for _, filename, _, _, _ in changes if
-                                    os.path.basename(filename).split('.')[-1] == 'java'}
-                elif src_code == 'csharp':
-                    files_touched = {filename for _, filename, _, _, _ in changes if
-                                    os.path.basename(filename).split('.')[-1] == 'cs'}
-
-                for filename in files_touched:
-                    # local_filename = os.path.normpath(filename.lstrip('/'))
-                    # logging.info(f"Generating PDGs for {filename}")
-                    try:
-                        output_path = './data/corpora_raw/%s/%s_%s/%d/%s.dot' % (
-                            repository_name, from_, to_, i, os.path.basename(filename))
+    git_handler = GitUtil(temp_dir=temp_loc, worktree=True)
+    # Shared between the processes, so a restarted run mostly hits the cache
+    extraction_cache = PdgCache(pdg_cache_location) if pdg_cache_location is not None else None
+
+    timer = StageTimer()
+    steps = queue.Queue(maxsize=2)
+    builder = threading.Thread(target=build_steps, args=(steps, timer, method_fuzziness, node_fuzziness),
+                               daemon=True)
+    builder.start()
+
+    # One extractor process serves both versions of the repository
+    with git_handler as gh, start_extractor(extractor_location, src_code, persistent_extractor,
+                                           extractor_processes) as extractor:
+        try:
+            # The Java extractor only looks at the file it is given, so the before side needs no checkout: the touched
+            # files are read from git as they are at from_^. The C# extractor compiles the whole project.
+            if src_code == 'java':
+                v1_files = gh.revision_files(subject_location)
+                v1 = v1_files.directory
+            else:
+                v1_files = None
+                v1 = gh.move_git_repo_to_tmp(subject_location, checkout=False)
+            v2 = gh.move_git_repo_to_tmp(subject_location, checkout=False)
+
+            os.makedirs('./temp/%d' % id_, exist_ok=True)
+            v1_pdg_generator = PdgGenerator(
+                repository_location=v1,
+                target_filename='before_pdg.dot',
+                target_location='./temp/%d' % id_,
+                extractor_location=extractor_location,
+                cache=extraction_cache,
+                extractor=extractor,
+                files=v1_files
+            )
+            v2_pdg_generator = PdgGenerator(
+                repository_location=v2,
+                target_filename='after_pdg.dot',
+                target_location='./temp/%d' % id_,
+                extractor_location=extractor_location,
+                cache=extraction_cache,
+                extractor=extractor)
+            pdg_cache = ChainPdgCache(v1_pdg_generator, v2_pdg_generator, src_code, workers=extractor_processes)
+            for chain in work:
+                logging.info(f"Working on chain: {chain}")
+                from_ = chain[0]
+                pdg_cache.clear()
+
+                with timer.stage('git', items=0):
+                    if v1_files is not None:
+                        v1_files.set_revision(from_ + '^')
+                    else:
+                        gh.set_git_to_rev(from_ + '^', v1)
+                    gh.set_git_to_rev(from_, v2)
+
+                    labeli_changes = dict()
+                    labeli_changes[0] = gh.process_diff_between_commits(from_ + '^', from_, v2)
+
+                previous_sha = from_
+                i = 1
+                for to_ in chain[1:]:
+                    with timer.stage('git'):
+                        gh.cherry_pick_on_top(to_, v2)
+
+                        changes = gh.process_diff_between_commits(from_ + '^', to_, v2)
+                        changes_by_file = defaultdict(list)
+                        for change in changes:
+                            changes_by_file[change[1]].append(change)
+
+                        labeli_changes[i] = gh.process_diff_between_commits(previous_sha, to_, v2)
+                    i += 1
+                    previous_sha = to_
+
+                    # find all java files touched in the changes
+                    # if use other languages, change the file extension
+                    # cs for C#, py for Python, etc.
+                    if src_code == 'java':
+                        files_touched = {filename for _, filename, _, _, _ in changes if
+                                         os.path.basename(filename).split('.')[-1] == 'java'}
+                    elif src_code == 'csharp':
+                        files_touched = {filename for _, filename, _, _, _ in changes if
+                                         os.path.basename(filename).split('.')[-1] == 'cs'}
+
+                    output_paths = {filename: './data/corpora_raw/%s/%s_%s/%d/%s.dot' % (
+                        repository_name, from_, to_, i, os.path.basename(filename)) for filename in files_touched}
+                    pending = list()
+                    for filename in sorted(files_touched):
+                        if os.path.exists(output_paths[filename]):
+                            print('Skipping %s as it exits' % output_paths[filename])
+                        else:
+                            pending.append(filename)
+
+                    with timer.stage('extract', items=len(pending)):
                         try:
-                            with open(output_path) as f:
-                                print('Skipping %s as it exits' % output_path)
-                                f.read()
-                        except FileNotFoundError:
-                            v1_pdg_generator(filename, src_code=src_code)
-                            v2_pdg_generator(filename, src_code=src_code)
-                            delta_gen = deltaPDG('./temp/%d/before_pdg.dot' % id_, m_fuzziness=method_fuzziness,
-                                                 n_fuzziness=node_fuzziness)
-                            delta_pdg = delta_gen('./temp/%d/after_pdg.dot' % id_,
-                                                  [ch for ch in changes if ch[1] == filename])
-                            delta_pdg = mark_originating_commit(delta_pdg, mark_origin(changes, labeli_changes),
-                                                                filename)
-                            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                            # nx.set_node_attributes(delta_pdg, local_filename, "filepath")
-                            # nx.drawing.nx_pydot.write_dot(quote_label(delta_pdg), output_path)
-                            merge_files_pdg(output_path)
-                    except Exception:
-                        pass
-                    # if len(files_touched) != 0:
-                    #     merged_path = merge_files_pdg(out_dir)
-                    #     clean_path = clean_graph(merged_path, repository_name)
-                    #     validate([clean_path], 1, 1, repository_name)  # Flexeme's paper uses 1-hop clustering
+                            pdg_cache.prepare(pending)
+                        except Exception as e:
+                            # Whatever is still missing is extracted file by file below
+                            logging.error(f"Error extracting PDGs in a batch: {e}")
+                        pdgs = dict()
+                        for filename in pending:
+                            # local_filename = os.path.normpath(filename.lstrip('/'))
+                            # logging.info(f"Generating PDGs for {filename}")
+                            try:
+                                pdgs[filename] = (pdg_cache.before(filename), pdg_cache.after(filename))
+                            except Exception:
+                                pass
+
+                    if pdgs:
+                        with timer.stage('waiting for the builder', items=0):
+                            steps.put(Step(changes, changes_by_file, dict(labeli_changes), pdgs, output_paths))
+                logging.info("PDGs extracted: %d, reused: %d" % (pdg_cache.extracted, pdg_cache.reused))
+                if extraction_cache is not None:
+                    logging.info("[PDG cache] %(hits)d hits, %(misses)d misses, %(bytes)d bytes"
+                                 % extraction_cache.stats())
+                logging.info("[Pipeline] %s" % timer.report())
+        finally:
+            steps.put(None)
+            builder.join()
+    logging.info("[Pipeline] %s" % timer.report())
 
 
 if __name__ == '__main__':
@@ -169,6 +378,12 @@ if __name__ == '__main__':
     parser.add_argument("thread_id_start", type=int, help="The starting id of the thread")
     parser.add_argument("number_of_threads", type=int, help="The number of threads")
     parser.add_argument("src_code", help="The source code language")
+    parser.add_argument("--pdg-cache", default=DEFAULT_PDG_CACHE, help="Directory caching the extracted PDGs")
+    parser.add_argument("--no-pdg-cache", action="store_true", help="Always run the extractor")
+    parser.add_argument("--one-shot-extractor", action="store_true",
+                        help="Start the Java extractor once per file instead of keeping one running per thread")
+    parser.add_argument("--extractor-processes", type=int, default=1,
+                        help="Java extractors each thread runs side by side, C# files are always extracted in turn")
 
     args = parser.parse_args()
 
@@ -178,6 +393,7 @@ if __name__ == '__main__':
     extractor_location = args.extractor_location
     n_workers = args.number_of_threads
     src_code = args.src_code
+    pdg_cache_location = None if args.no_pdg_cache else args.pdg_cache
 
     try:
         with open(json_location) as f:
@@ -191,9 +407,11 @@ if __name__ == '__main__':
     list_to_tangle = [list_to_tangle[i:i + chunk_size] for i in range(0, len(list_to_tangle), chunk_size)]
 
     processes = []
-    id_ = int(sys.argv[5])
+    id_ = args.thread_id_start
     for work in list_to_tangle:
-        process = Process(target=worker, args=(work, subject_location, id_, temp_loc, extractor_location, src_code))
+        process = Process(target=worker, args=(work, subject_location, id_, temp_loc, extractor_location, src_code,
+                                                pdg_cache_location, not args.one_shot_extractor,
+                                                args.extractor_processes))
         id_ += 1
         processes.append(process)
         process.start()
@@ -5,7 +5,7 @@ from threading import Thread
 import networkx as nx
 
 from Util.general_util import get_pattern_paths
-from deltaPDG.Util.pygraph_util import read_graph_from_dot, obj_dict_to_networkx
+from deltaPDG.Util.pygraph_util import read_nxgraph_from_dot
 
 
 def worker(all_graph_locations, corpus_name):
@@ -18,7 +18,7 @@ def worker(all_graph_locations, corpus_name):
         print('[Scan and clean] Cleaning data-point %s' % data_point_name)
 
         try:
-            graph = obj_dict_to_networkx(read_graph_from_dot(graph_location))
+            graph = read_nxgraph_from_dot(graph_location)
         except (TypeError, ValueError):
             continue
 
@@ -15,6 +15,7 @@ from typing import List, Tuple, Any
 
 import numpy as np
 
+from deltaPDG.Util.commit_index import CommitIndex, commit_index_location
 from deltaPDG.Util.git_util import GitUtil
 
 # some VERB keywords that are used to identify bug-fixing and feature-implementing commits
@@ -184,24 +185,28 @@ def both_are_atomic(gh, path):
     return inner_predicate
 
 
-def tangle_by_file(subject, temp_loc):
+def tangle_by_file(subject, temp_loc, index_location=None):
     """
     Analyses the commit history in a Git repository, identifies relevant changes that were
     committed by the same author within a certain period of time (point 1)
     and that do not contain too many keywords in the message, (point 4)
     links those changes into chains, and returns all such chains of commits.
+
+    The history is read through a CommitIndex of the repository, kept at index_location when given.
     """
     days = 14
     up_to_concerns = 4
 
-    git_handler = GitUtil(temp_dir=temp_loc)
+    index = CommitIndex(subject, index_location, temp_dir=temp_loc)
 
-    with git_handler as gh:
-        temp = gh.move_git_repo_to_tmp(subject)
-        candidates = gh.get_all_commit_hashes_authors_dates_messages(temp)
+    with index as gh:
+        candidates = gh.candidates()
         # commits in groups of authors
         candidates_by_author = defaultdict(list)
-        for sha, author, date, msg, diff in candidates:
+        for sha, author, date, msg in candidates:
+            # Reading the whole log used to skip any commit with a line containing this, not only merges
+            if 'Merge: ' in msg:
+                continue
             candidates_by_author[author].append((sha, date, msg))
         candidates_by_author = dict(candidates_by_author)
 
@@ -232,9 +237,10 @@ def tangle_by_file(subject, temp_loc):
 
 
 def process_repository(repository_name):
-    history_flat = tangle_by_file('../subjects/%s' % repository_name, '../temp')
     output_dir = '../out/{}'.format(repository_name)
     os.makedirs(output_dir, exist_ok=True)
+    history_flat = tangle_by_file('../subjects/%s' % repository_name, '../temp',
+                                  commit_index_location(output_dir, repository_name))
     with open(os.path.join(output_dir, '{}_history_filtered_flat.json'.format(repository_name)), 'w') as f:
         f.write(json.dumps(history_flat))
 
@@ -0,0 +1,52 @@
+import random
+
+import networkx as nx
+import pytest
+
+from deltaPDG.Util.binary_graph import read_binary_graph, write_binary_graph
+
+SPANS = ['1-3', '12-12', '0-0', '01-3', '1-03', '00-0', '2147483647-2147483647', '2147483648-2147483648',
+         '1-2147483648', '2147483648-1', '3', '1-3 ', '-1-3', '١-٣', '']
+
+
+def same(a: nx.MultiDiGraph, b: nx.MultiDiGraph) -> bool:
+    return list(a.nodes(data=True)) == list(b.nodes(data=True)) \
+        and list(a.edges(keys=True, data=True)) == list(b.edges(keys=True, data=True))
+
+
+def random_graph(rng: random.Random) -> nx.MultiDiGraph:
+    graph = nx.MultiDiGraph()
+    for i in range(rng.randint(0, 30)):
+        data = dict()
+        if rng.random() < .8:
+            data['span'] = rng.choice(SPANS)
+        if rng.random() < .5:
+            data['label'] = rng.choice(['x', '"quoted"', 'if (a > b)', ''])
+        if rng.random() < .3:
+            data['cluster'] = rng.choice(['A.f', 'A.g'])
+        graph.add_node(rng.choice(['n%d' % i, 'm%d_%d' % (i, i), '"q%d"' % i]), **data)
+    nodes = list(graph.nodes)
+    for _ in range(rng.randint(0, 60) if nodes else 0):
+        data = {'style': rng.choice(['solid', 'dotted', 'bold'])} if rng.random() < .7 else dict()
+        key = rng.choice([None, 3, '0', 'x'])
+        graph.add_edge(rng.choice(nodes), rng.choice(nodes), key=key, **data)
+    return graph
+
+
+@pytest.mark.parametrize('span', SPANS)
+def test_span_round_trip(tmp_path, span):
+    graph = nx.MultiDiGraph()
+    graph.add_node('n0', span=span, label='x')
+    graph.add_edge('n0', 'n0')
+    location = str(tmp_path / 'graph.npz')
+    write_binary_graph(graph, location)
+    assert read_binary_graph(location).nodes['n0']['span'] == span
+
+
+def test_random_round_trip(tmp_path):
+    rng = random.Random(0)
+    location = str(tmp_path / 'graph.npz')
+    for _ in range(200):
+        graph = random_graph(rng)
+        write_binary_graph(graph, location)
+        assert same(read_binary_graph(location), graph)
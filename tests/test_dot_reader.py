@@ -0,0 +1,79 @@
+import networkx as nx
+import pydot
+import pytest
+
+from deltaPDG.Util.dot_reader import parse_dot
+from deltaPDG.Util.pygraph_util import obj_dict_to_networkx, read_nxgraph_from_dot
+
+
+def through_pydot(text: str) -> nx.MultiDiGraph:
+    return obj_dict_to_networkx(pydot.graph_from_dot_data(text)[0].obj_dict)
+
+
+def same(a: nx.MultiDiGraph, b: nx.MultiDiGraph) -> bool:
+    return list(a.nodes(data=True)) == list(b.nodes(data=True)) \
+        and list(a.edges(keys=True, data=True)) == list(b.edges(keys=True, data=True))
+
+
+def test_as_pydot():
+    text = '''digraph "extractedGraph" {
+        // A comment
+        graph [rankdir=LR];
+        node [shape=box];
+        m0_0 [label="void f()", span="1-3"];
+        n1 [label="if (a \\"q\\" > b)", span="2"];
+        n2 [label="x", span="3", weight=-1];
+        free [label="no span"];
+        m0_0 -> n1 [style=solid, label="CTRL"];
+        m0_0 -> n1 [style=dotted];
+        n1 -> n2 -> m0_0 [color=red];
+        subgraph cluster_0 {
+            label="A.f";
+            n3 [span="4"];
+        }
+        subgraph cluster_1 {
+            graph [label="A.g"];
+            n4 [span="5"];
+        }
+    }'''
+    assert same(parse_dot(text), through_pydot(text))
+
+
+def test_node_port_is_dropped():
+    text = 'digraph G { a:p [span="1-2"]; b:q:n [span="3"]; }'
+    assert list(parse_dot(text).nodes(data=True)) == [('a', {'span': '1-2'}), ('b', {'span': '3'})]
+    assert same(parse_dot(text), through_pydot(text))
+    # Quoted IDs keep their quotes as in pydot, which keeps their port too
+    assert list(parse_dot('digraph G { "b":"q":n [span="3"] }').nodes) == ['"b"']
+
+
+def test_edge_port_is_dropped():
+    graph = parse_dot('digraph G { a [span="1-2"]; b [span="3-4"]; a:p -> b:q:n [label="x"]; a:"p":s -> c; }')
+    assert list(graph.nodes(data=True)) == [('a', {'span': '1-2'}), ('b', {'span': '3-4'}), ('c', {})]
+    assert list(graph.edges(data=True)) == [('a', 'b', {'label': 'x'}), ('a', 'c', {})]
+
+
+def test_semicolon_between_attributes_is_rejected():
+    text = 'digraph G { a [span="1-2"; label="x"] }'
+    assert pydot.graph_from_dot_data(text) is None
+    with pytest.raises(ValueError):
+        parse_dot(text)
+
+
+@pytest.mark.parametrize('text', ['digraph G { -2 [span="1"] }', 'digraph G { a -> -2 }'])
+def test_negative_node_id_is_rejected(text):
+    assert pydot.graph_from_dot_data(text) is None
+    with pytest.raises(ValueError):
+        parse_dot(text)
+
+
+def test_negative_attribute_value():
+    text = 'digraph G { a [span="1-2", x=-1, y=-.5] }'
+    assert list(parse_dot(text).nodes(data=True)) == [('a', {'span': '1-2', 'x': '-1', 'y': '-.5'})]
+    assert same(parse_dot(text), through_pydot(text))
+
+
+def test_malformed_file_reads_as_empty_graph(tmp_path):
+    location = tmp_path / 'pdg.dot'
+    location.write_text('digraph G { a [span="1-2"; label="x"] }')
+    assert read_nxgraph_from_dot(str(location)).number_of_nodes() == 0
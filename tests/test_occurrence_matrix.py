@@ -0,0 +1,56 @@
+import os
+import subprocess
+
+import numpy as np
+
+from confidence_voters.Util.generate_corpus_file import build_occurrence_matrix, generate_occurrence_matrix
+
+
+def git(repository, *args):
+    subprocess.run(['git', '-c', 'user.name=Tester', '-c', 'user.email=tester@example.com'] + list(args),
+                   cwd=repository, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def commit(repository, message, **files):
+    for name, content in files.items():
+        with open(os.path.join(repository, name + '.cs'), 'w') as f:
+            f.write(content)
+    git(repository, 'add', '-A')
+    git(repository, 'commit', '-q', '-m', message)
+    return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repository, stdout=subprocess.PIPE,
+                          check=True).stdout.decode('utf-8').strip()
+
+
+def coo(matrix):
+    matrix = matrix.tocoo()
+    order = np.lexsort((matrix.col, matrix.row))
+    return matrix.row[order].tolist(), matrix.col[order].tolist(), matrix.data[order].tolist()
+
+
+def test_generate_occurrence_matrix():
+    files = ['/a.cs', '/b.cs', '/a.cs', '/c.cs']
+    commits = ['c1', 'c2', 'c3']
+    file_commit_map = {'/a.cs': ['c1', 'c2'], '/b.cs': ['c1', 'c3', 'c3'], '/c.cs': ['c3']}
+    matrix = generate_occurrence_matrix(files, commits, file_commit_map)
+    assert matrix.shape == (4, 3)
+    # Rows are the first position of a file, repeated (file, commit) pairs add up
+    assert coo(matrix) == ([0, 0, 1, 1, 3], [0, 1, 0, 2, 2], [1, 1, 1, 2, 1])
+
+
+def test_build_occurrence_matrix(tmp_path):
+    repository = str(tmp_path / 'subject')
+    os.makedirs(repository)
+    git(repository, 'init', '-q')
+    commit(repository, 'Add a and b', a='a\n', b='b\n')
+    c2 = commit(repository, 'Change a', a='a\nA\n')
+    c3 = commit(repository, 'Change b, add c', b='b\nB\n', c='c\n')
+    commit(repository, 'Undo a merge\n\nMerge: of nothing', a='a\n')
+
+    matrix, file_index = build_occurrence_matrix(repository, str(tmp_path), None)
+    assert file_index == {'/a.cs': 0, '/b.cs': 1, '/c.cs': 2}
+    assert matrix.shape == (3, 3)
+    assert coo(matrix) == ([0, 0, 1, 1, 2], [0, 1, 0, 2, 2], [1, 1, 1, 1, 1])
+
+    matrix, file_index = build_occurrence_matrix(repository, str(tmp_path), {c2, c3})
+    assert file_index == {'/a.cs': 0, '/b.cs': 1, '/c.cs': 2}
+    assert coo(matrix) == ([0, 1, 2], [0, 1, 1], [1, 1, 1])
@@ -6,14 +6,17 @@ import sys
 import jsonpickle
 from tqdm import tqdm
 
-from Util.general_util import get_pattern_paths
+from Util.general_util import get_pattern_paths, parse_graph_flags
+from deltaPDG.Util.corpus_store import CorpusStore, corpus_store_location, datapoint_of
 from wl_kernel.wl_kernel_untangle import validate
 
 if __name__ == '__main__':
-    times = int(sys.argv[1])
-    edges_kept = sys.argv[2]
-    k_hop = int(sys.argv[3])
-    repository_name = sys.argv[4]
+    graph_name, store, graph_cache, args = parse_graph_flags(sys.argv)
+    graph_pattern = '*' + graph_name
+    times = int(args[1])
+    edges_kept = args[2]
+    k_hop = int(args[3])
+    repository_name = args[4]
     l = [False, True]
     configs = list(itertools.product(l, repeat=3))[1:]
     for with_data, with_call, with_name in tqdm(configs):
@@ -29,8 +32,11 @@ if __name__ == '__main__':
             suffix += "n"
             edges_kept += "name"
 
-        all_graphs = sorted(
-            get_pattern_paths('*merged.dot', os.path.join('.', 'data', 'corpora_clean', repository_name)))
+        if store:
+            all_graphs = CorpusStore(corpus_store_location(repository_name)).entries()
+        else:
+            all_graphs = sorted(
+                get_pattern_paths(graph_pattern, os.path.join('.', 'data', 'corpora_clean', repository_name)))
         try:
             with open('./out/%s/wl_%s_%d_results_%s.csv' % (repository_name, edges_kept, k_hop, suffix)) as f:
                 lines = f.read()
@@ -46,11 +52,13 @@ if __name__ == '__main__':
                 continue
         except FileNotFoundError:
             pass
-        all_graphs = [d for d in all_graphs
-                      if os.path.basename(os.path.dirname(os.path.dirname(d))) not in datapoints_done]
+        all_graphs = [d for d in all_graphs if datapoint_of(d)[0] not in datapoints_done]
         random.shuffle(all_graphs)
         print(len(all_graphs))
         if len(all_graphs) > 0:
-            validate(all_graphs, times, k_hop, repository_name, edges_kept=edges_kept, suffix=suffix)
+            validate(all_graphs, times, k_hop, repository_name, edges_kept=edges_kept, suffix=suffix,
+                     graph_cache=graph_cache)
             with open('./out/%s/wl_%s_%d_results_%s.json' % (repository_name, edges_kept, k_hop, suffix), 'w') as f:
                 f.write(jsonpickle.encode({'done'}))
+    if graph_cache is not None:
+        print('[Graph cache] %d hits, %d misses' % (graph_cache.hits, graph_cache.misses))
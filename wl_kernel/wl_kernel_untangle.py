@@ -18,7 +18,8 @@ from tqdm import tqdm
 
 from Util.evaluation import evaluate
 from confidence_voters.confidence_voters import remove_all_except
-from deltaPDG.Util.pygraph_util import obj_dict_to_networkx, read_graph_from_dot
+from deltaPDG.Util.corpus_store import datapoint_of, graph_location_of
+from deltaPDG.Util.pygraph_util import read_delta_graph
 
 
 def split_camel_case(input: str) -> List[str]:
@@ -68,8 +69,8 @@ def deltaPDG_to_list_of_Graphs(delta: nx.MultiDiGraph, khop_k: int = 1) -> Tuple
     return seeds, result
 
 
-def validate(files: List[str], times, k_hop, repository_name, edges_kept="all",
-             with_data: bool = True, with_call: bool = True, with_name: bool = True, suffix="raw"):
+def validate(files: List, times, k_hop, repository_name, edges_kept="all",
+             with_data: bool = True, with_call: bool = True, with_name: bool = True, suffix="raw", graph_cache=None):
     n_workers = 1
     chunck_size = int(len(files) / n_workers)
     while (chunck_size == 0) and (n_workers > 1):
@@ -79,9 +80,8 @@ def validate(files: List[str], times, k_hop, repository_name, edges_kept="all",
 
     def worker(work):
         for graph_location in tqdm(work, leave=False):
-            chain = os.path.basename(os.path.dirname(os.path.dirname(graph_location)))
-            q = int(os.path.basename(os.path.dirname(graph_location)))
-            graph = obj_dict_to_networkx(read_graph_from_dot(graph_location))
+            chain, q = datapoint_of(graph_location)
+            graph = read_delta_graph(graph_location, graph_cache)
             graph = remove_all_except(graph, edges_kept)
 
             if len(graph.nodes) == 0:
@@ -140,7 +140,7 @@ def validate(files: List[str], times, k_hop, repository_name, edges_kept="all",
                             label.append(-1)
                             graph.add_node(node, **data)
 
-            nx.drawing.nx_pydot.write_dot(graph, graph_location[:-4] + '_output_wl_%d.dot' % k_hop)
+            nx.drawing.nx_pydot.write_dot(graph, graph_location_of(graph_location)[:-4] + '_output_wl_%d.dot' % k_hop)
 
             truth = np.asarray(truth)
             label = np.asarray(label)